@@ -234,7 +234,8 @@ class ControlGUI:
             height = 45,
             relief = RAISED,
             borderwidth = 1)
-        Button(
+        ## Start button. Disabled while games are being looked for.
+        self.startButton = Button(
             buttonFrame,
             text = "START",
             command = self.start,
@@ -242,7 +243,8 @@ class ControlGUI:
             default = ACTIVE,
             padx = 15,
             pady = 3,
-            ).place(relx = 0.5, rely = 0.5, anchor = CENTER)
+            )
+        self.startButton.place(relx = 0.5, rely = 0.5, anchor = CENTER)
         
         #lay out frames
         generatorFrame.grid(
@@ -269,6 +271,7 @@ class ControlGUI:
         #load modules
         ## set of all currently loaded modules
         self.loadedModules = set() #none loaded yet
+        self._foundGames = []
         # schedule this for after the window has itself set up, otherwise error dialogs will
         # mess up focus for the Map name text entry box.
         # this is actually a bug in Tkinter, seemingly: http://bugs.python.org/issue9673
@@ -308,10 +311,7 @@ class ControlGUI:
         self.generatorList = list(self.generators.keys())
         self.generatorList.sort()
         ## list of game names. Used in GUI.
-        self.gameList = []
-        for executor in self.executors.values():
-            self.gameList.extend(executor.usableGames())
-        self.gameList.sort()
+        self.gameList = sorted(self._foundGames)
         #update contents of drop-down menus
         self._updateOptionMenuContents(self.generatorSelector, self.generatorList)
         self._updateOptionMenuContents(self.gameSelector, self.gameList)
@@ -341,6 +341,26 @@ class ControlGUI:
             msg = 'Unable to init ' + str(mapFormat) + ' executor\n\n'
             msg = msg + traceback.format_exc()
             ErrorFatal(msg, self.window.destroy)
+        else:
+            #load game data in the background, so generation starts with it
+            #ready and the GUI stays responsive
+            preloader = threading.Thread(
+                target = self._preload,
+                args = (self.selectedExecutor,)
+                )
+            preloader.daemon = True
+            preloader.start()
+
+    ## Loads data the executor needs for the selected game. This method is
+    #  called by a background thread. Errors are ignored here; they happen
+    #  again and are reported when the data is used.
+    #
+    #  @param executor Executor to preload
+    def _preload(self, executor):
+        try:
+            executor.preload()
+        except Exception:
+            pass
 
     ## Disables game menu entries not supported by current generator and
     #  forces to supported game. Also creates an instance of the generator so
@@ -386,9 +406,46 @@ class ControlGUI:
             element.configure(state = state)
 
     ## Action for 'Refresh Modules' button. Reloads interfaces and modules, then updates GUI accordingly.
+    #
+    #  Looking for installed games can take a while, so it is done on a
+    #  background thread, and the GUI is updated when it is done.
     def refreshModules(self):
+        if self._foundGames == None:
+            return #still looking for games
         self.reloadModules()
-        self.updateGUIModules()
+        for executor in self.executors.values():
+            executor.clearCache() #installed games may have changed
+        self.startButton.configure(state = DISABLED)
+        ## games found by _findGames(), or None while it runs
+        self._foundGames = None
+        finder = threading.Thread(
+            target = self._findGames,
+            args = (list(self.executors.values()),)
+            )
+        finder.daemon = True
+        finder.start()
+        self._waitForGames()
+
+    ## Looks for the games each executor can use. This method is called by a
+    #  background thread.
+    #
+    #  @param executors list of Executor classes
+    def _findGames(self, executors):
+        games = []
+        for executor in executors:
+            try:
+                games.extend(executor.usableGames())
+            except Exception:
+                traceback.print_exc()
+        self._foundGames = games
+
+    ## Updates the GUI once _findGames() is done
+    def _waitForGames(self):
+        if self._foundGames == None:
+            self.window.after(50, self._waitForGames)
+        else:
+            self.updateGUIModules()
+            self.startButton.configure(state = NORMAL)
 
     ## Display controls to set custom compilation options. Connected to "Set"
     #  button.
@@ -414,6 +471,8 @@ class ControlGUI:
             return
         ## list of map files generated.
         self.mapFiles = []
+        ## list of Map objects the map files are saved from
+        self.mapObjects = []
         self.thread = threading.Thread(target = self.run)
         #Create progress GUI and attach as listener
         self.progressGUI = ProgressGUI(self.window, self.thread)
@@ -458,7 +517,7 @@ class ControlGUI:
             return
         self.progressGUI.write('\n\n')
         #set maps to compile
-        self.selectedExecutor.setMapList(self.mapFiles)
+        self.selectedExecutor.setMapList(self.mapFiles, self.mapObjects)
         if self.runEditor.get() == 1:
             try:
                 self.selectedExecutor.edit() #open editor
@@ -653,7 +712,8 @@ class ControlGUI:
         path = path + str(1 + len(self.mapFiles)) #add number
         path = path + '.' + extension #add format extension
         self.mapFiles.append(path)
-        return self.maps[extension](path, game)
+        self.mapObjects.append(self.maps[extension](path, game))
+        return self.mapObjects[-1]
 
 ## Thread safe implementation of ProgressObserver. Displays progress in a
 #  Toplevel window.
@@ -52,6 +52,7 @@ class Executor(ProgressSubject):
         self._quality = 2
         ## List of map files to compile
         self._mapList = None
+        self._maps = None
         self.setGameID(gameID)
         ## ConfigGUI implementation to contain GUI mess.
         if self.__class__.configGUI == None or \
@@ -59,6 +60,21 @@ class Executor(ProgressSubject):
             raise NotImplementedError()
         self.configGUI = self.__class__.configGUI(self.__class__.name, self)
 
+    ## Forget anything worked out about installed software, such as the
+    #  usable games, so it is checked again. The default implementation does
+    #  nothing.
+    @staticmethod
+    def clearCache():
+        pass
+
+    ## Load data needed to generate and compile maps for the current game,
+    #  such as entity definitions, so it is ready when it is first used.
+    #
+    #  Called on a background thread when a game is selected. Must be thread
+    #  safe. The default implementation does nothing.
+    def preload(self):
+        pass
+
     ## GUI to configure compilation options
     def showGUI(self, rootwindow):
         self.configGUI.showGUI(rootwindow)
@@ -100,11 +116,17 @@ class Executor(ProgressSubject):
     #
     #  @param mapList a list of paths to uncompiled map files. The first map in
     #  the list is the map that is loaded in the game or editor, if any.
-    def setMapList(self, mapList):
+    #  @param maps optional list of the Map objects the files were saved from,
+    #  in the same order. Executors can inspect them instead of loading the
+    #  files again.
+    def setMapList(self, mapList, maps = None):
         #able to accept single map as string instead of 1-item list
         if type(mapList) == str:
             mapList = [mapList]
         assert type(mapList) == list
+        assert maps == None or len(maps) == len(mapList)
+        ## Map objects the map files were saved from, or None
+        self._maps = maps
         #all must be valid files
         assert all(map(os.path.isfile, mapList))
         #all must have correct file extension
@@ -1,4 +1,4 @@
-import os, gameids, copy, re
+import os, gameids, copy, re, pickle, tempfile, hashlib, threading, mmap, struct
 from formats.sdkutil import SDKUtil
 
 
@@ -127,6 +127,39 @@ class FGD:
 
     _FGDDict = {}
 
+    #  FGD objects by canonical file path, see fromFile()
+    _FileDict = {}
+
+    #  Held while parsing, so FGD files can be loaded on a background thread
+    #  while they are used by another.
+    _lock = threading.RLock()
+
+    ## Get the per-user directory parsed FGD files are cached in by default
+    #
+    #  @return path under the user's local application data folder on
+    #  Windows, or under $XDG_CACHE_HOME (~/.cache) elsewhere
+    @staticmethod
+    def _defaultCacheDirectory():
+        if os.name == 'nt':
+            base = os.getenv('LOCALAPPDATA') or os.path.expanduser('~')
+        else:
+            base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(base, 'level-generator', 'fgd')
+
+    ## Directory parsed FGD files are cached in between runs. Set to None to
+    #  disable the cache. The directory is created readable only by the
+    #  current user, and cache files are ignored unless it and they belong to
+    #  the current user and nobody else can write to them.
+    cacheDirectory = _defaultCacheDirectory.__func__()
+
+    #  Version of the cache format. Change this whenever parsing changes, so
+    #  old cache files are ignored.
+    _CACHE_VERSION = 3
+
+    #  First bytes of a snapshot file, including the snapshot format version.
+    #  See writeSnapshot().
+    _SNAPSHOT_MAGIC = b'LGFFGD01'
+
     ## Get the appropriate FGD object for the specified game
     #
     #  @param gameId game ID
@@ -162,10 +195,61 @@ class FGD:
             elif gameId == gameids.GMOD:
                 raise NotImplementedError() ## @todo implement
             
-            cls._FGDDict[gameId] = FGD(path)
+            cls._FGDDict[gameId] = cls.fromFile(path)
 
         return cls._FGDDict[gameId]
 
+    ## Get the FGD object for a file. Each file is parsed once and shared by
+    #  every game and every FGD file that uses or includes it.
+    #
+    #  @param filepath path of FGD file
+    #  @return FGD object
+    @classmethod
+    def fromFile(cls, filepath):
+        key = os.path.normcase(os.path.realpath(filepath))
+        with cls._lock:
+            if key not in cls._FileDict:
+                cls._FileDict[key] = FGD(filepath)
+            return cls._FileDict[key]
+
+    ## Make getGameFGD() return the FGD in a snapshot file written by
+    #  writeSnapshot(), instead of loading the game's FGD file. Use this to
+    #  set up worker processes.
+    #
+    #  @param gameId game ID
+    #  @param path path of snapshot file
+    @classmethod
+    def useSnapshot(cls, gameId, path):
+        with cls._lock:
+            cls._FGDDict[gameId] = cls.fromSnapshot(path)
+
+    ## Open a snapshot file written by writeSnapshot().
+    #
+    #  The file is memory mapped read-only and nothing is parsed. Each class is
+    #  read from the mapping the first time it is used, so processes that
+    #  open the same snapshot share its pages and only hold the classes they
+    #  use.
+    #
+    #  @param path path of snapshot file
+    #  @return FGD object
+    @classmethod
+    def fromSnapshot(cls, path):
+        with open(path, 'rb') as f:
+            snapshot = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, indexOffset = struct.unpack_from('<8sQ', snapshot, 0)
+        if magic != FGD._SNAPSHOT_MAGIC:
+            raise IOError(path + ' is not an FGD snapshot of this version')
+        index = pickle.loads(snapshot[indexOffset:])
+        fgd = cls.__new__(cls)
+        fgd.filepath = index['filepath']
+        fgd.entities = {}
+        fgd.files = index['files']
+        fgd._sources = []
+        fgd._inherited = {}
+        for name, offset, length in index['classes']:
+            fgd.entities[name] = FGD._SnapshotEntity(fgd, snapshot, offset, length)
+        return fgd
+
     ## Parse nested segments. Each segment is replaced with a list of the section's contents
     #
     #  @param data string to operate on
@@ -212,46 +296,6 @@ class FGD:
                 startmark = data.find(start, cursor)
         return result[0]
 
-    ## after heirarchy of brackets is formed, break strings into multiple strings at newlines
-    # ['abc \n def',['a \n b \n c'],'gh \n i'] -->['abc ', ' def',['a ', ' b ', ' c'],'gh ', ' i']
-    @staticmethod
-    def _breakNewlines(item):
-        if type(item) == list:
-            thing = 0
-            while thing < len(item):
-                broken = FGD._breakNewlines(item[thing])
-                if type(item[thing]) == str:
-                    item.pop(thing)
-                    for i in range(len(broken)):
-                        item.insert(thing + i, broken[i])
-                else:
-                    item[thing] = broken
-                thing += 1
-        else:
-            item = item.strip()
-            item = item.split('\n')
-        return item
-
-    ## replace strings with symbols. symbol can be used to access string with self.stringDict
-    #
-    #  @param symbol quote character that bounds strings
-    def _parseQuotes(self, symbol):
-        ## dictionary of symbol-string pairs.
-        #  Strings are replaced with symbols. This dict is used to retrieve the string contents when a symbol is
-        #  encountered.
-        self.stringDict = {}
-        strings = 0
-        data = self.data.split(symbol)
-        if not len(data)%2 == 1:
-            #must be odd number of chunks for even number of quotes
-            raise Exception('quote left open in string')
-        for i in range(1,len(data),2):
-            name = '&stringsymbol%(#)d&' % {'#' : strings}
-            self.stringDict[name] = data[i]
-            data[i] = name
-            strings += 1
-        self.data = ''.join(data)
-
     ## Constructor
     #
     #  @param filepath path of FGD file to parse
@@ -260,19 +304,36 @@ class FGD:
         ## Path of FGD file this object represents
         self.filepath = os.path.abspath(filepath)
         self.filepath = self.filepath.replace('\\','/')
-        ## Dict of entities described by this file. Key is entity name, value is entity object.
+        ## Dict of entities described by this file. Key is entity name, value
+        #  is entity object, or an FGD._LazyEntity if the class has not been
+        #  used yet. Use FGD[key] to get a parsed entity.
         self.entities = {}
-        self._load(filepath)
+        ## Paths of this file and of every file it includes
+        self.files = [self.filepath]
+        #  paths of included files and FGD._LazyEntity objects, in file order
+        self._sources = []
+        #  inherited parameters by tuple of base class names, see
+        #  _getInherited()
+        self._inherited = {}
+        if not self._loadCache():
+            self._load(filepath)
+            self._saveCache()
 
     ## enables len(FGD) for number of entities in file
     def __len__(self):
         return len(self.entities)
 
-    ## enables access via FGD[key]
+    ## enables access via FGD[key]. The class definition is parsed the first
+    #  time it is used.
     #
     #  @param key name of entity to retrieve
     def __getitem__(self, key):
-        return self.entities[key]
+        entity = self.entities[key]
+        if not isinstance(entity, FGD.Entity):
+            with FGD._lock:
+                entity = entity.load()
+            self.entities[key] = entity
+        return entity
 
     ## enables iteration through contained entities
     def __iter__(self):
@@ -285,8 +346,164 @@ class FGD:
        return item in self.entities
 
     def _addEntity(self, entity):
-        assert isinstance(entity, FGD.Entity)
+        assert isinstance(entity, (FGD.Entity, FGD._LazyEntity))
         self.entities[entity.name] = entity
+        self._sources.append(entity)
+
+    ## Write every class, fully parsed, to a snapshot file that other
+    #  processes can open with fromSnapshot() or useSnapshot().
+    #
+    #  The file holds a header, one pickled FGD.Entity per class, and an index
+    #  of class names and positions at the end.
+    #
+    #  @param path path of snapshot file
+    def writeSnapshot(self, path):
+        classes = []
+        handle, temporaryPath = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(struct.pack('<8sQ', FGD._SNAPSHOT_MAGIC, 0))
+                for name in self:
+                    data = pickle.dumps(self[name], pickle.HIGHEST_PROTOCOL)
+                    classes.append((name, f.tell(), len(data)))
+                    f.write(data)
+                index = {
+                    'filepath': self.filepath,
+                    'files': self.files,
+                    'classes': classes
+                    }
+                indexOffset = f.tell()
+                pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+                f.seek(0)
+                f.write(struct.pack('<8sQ', FGD._SNAPSHOT_MAGIC, indexOffset))
+            os.replace(temporaryPath, path)
+        except:
+            os.remove(temporaryPath)
+            raise
+
+    ## INTERNAL! Add the entities of an included file
+    #
+    #  @param filepath path of included file
+    def _addInclude(self, filepath):
+        imported = FGD.fromFile(filepath)
+        self.entities.update(imported.entities)
+        self.files += imported.files
+        self._sources.append(imported.filepath)
+
+    ## INTERNAL! Get the parameters, inputs and outputs inherited from base
+    #  classes, merged in order. Classes with the same bases share the
+    #  result.
+    #
+    #  @param bases tuple of base class names
+    #  @return list of (dict by name, list) pairs for parameters, inputs and
+    #  outputs
+    def _getInherited(self, bases):
+        if bases not in self._inherited:
+            if len(bases) == 1:
+                base = self[bases[0]]
+                groups = [base.parameters, base.inputs, base.outputs]
+            else:
+                merged = [{}, {}, {}]
+                for base in bases:
+                    base = self[base]
+                    for params, group in zip(merged, (base.parameters, base.inputs, base.outputs)):
+                        for param in group:
+                            params[param.name] = param
+                groups = [list(x.values()) for x in merged]
+            self._inherited[bases] = [({x.name: x for x in group}, group) for group in groups]
+        return self._inherited[bases]
+
+    ## INTERNAL! Get the path of the cache file for this FGD file, or None if
+    #  caching is disabled.
+    def _getCachePath(self):
+        if FGD.cacheDirectory == None:
+            return None
+        key = hashlib.sha1(os.path.realpath(self.filepath).encode('utf-8')).hexdigest()
+        return os.path.join(FGD.cacheDirectory, key + '.fgdcache')
+
+    ## INTERNAL! Check that a cache directory or file can be trusted: loading
+    #  a cache file runs code from it, so nobody but the current user may have
+    #  been able to write it.
+    #
+    #  @param path path of directory or file
+    #  @return True if it belongs to the current user and only they can
+    #  write to it
+    @staticmethod
+    def _isCacheTrusted(path):
+        if not hasattr(os, 'getuid'):
+            return True #per-user application data folder on Windows
+        stat = os.lstat(path)
+        return stat.st_uid == os.getuid() and stat.st_mode & 0o022 == 0
+
+    ## INTERNAL! Get the modification time and size of every file this FGD
+    #  file was parsed from.
+    def _getFileStamps(self):
+        stamps = []
+        for path in self.files:
+            stat = os.stat(path)
+            stamps.append((path, stat.st_mtime_ns, stat.st_size))
+        return stamps
+
+    ## INTERNAL! Load entities from the cache file, if there is one and none
+    #  of the files it was parsed from have changed since.
+    #
+    #  @return True if the entities were loaded
+    def _loadCache(self):
+        cachePath = self._getCachePath()
+        if cachePath == None or not os.path.isfile(cachePath):
+            return False
+        try:
+            if not (FGD._isCacheTrusted(FGD.cacheDirectory) and FGD._isCacheTrusted(cachePath)):
+                return False
+            with open(cachePath, 'rb') as f:
+                cache = pickle.load(f)
+            if cache['version'] != FGD._CACHE_VERSION or cache['filepath'] != self.filepath:
+                return False
+            for path, mtime, size in cache['stamps']:
+                stat = os.stat(path)
+                if stat.st_mtime_ns != mtime or stat.st_size != size:
+                    return False
+        except Exception:
+            # missing include, unreadable or outdated cache file
+            return False
+        for source in cache['sources']:
+            if isinstance(source, str):
+                self._addInclude(source)
+            else:
+                source.parent = self
+                self._addEntity(source)
+        return True
+
+    ## INTERNAL! Save entities to the cache file. Failure to write the cache
+    #  is ignored.
+    def _saveCache(self):
+        cachePath = self._getCachePath()
+        if cachePath == None:
+            return
+        cache = {
+            'version': FGD._CACHE_VERSION,
+            'filepath': self.filepath,
+            'stamps': self._getFileStamps(),
+            'sources': self._sources
+            }
+        try:
+            os.makedirs(FGD.cacheDirectory, mode=0o700, exist_ok=True)
+            if not FGD._isCacheTrusted(FGD.cacheDirectory):
+                return
+            # write to a temporary file first, so other processes never read
+            # a partly written cache
+            handle, temporaryPath = tempfile.mkstemp(dir=FGD.cacheDirectory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporaryPath, cachePath)
+        except Exception:
+            try:
+                os.remove(temporaryPath)
+            except OSError:
+                pass
 
     def _load(self, filepath):
         assert os.path.isfile(filepath)
@@ -295,65 +512,391 @@ class FGD:
 
         #load file
         with open(filepath, 'r') as f:
-            ## contents of file
-            self.data = f.readlines()
-        
-        #preprocess file
-        #remove comments
-        for i in range(len(self.data)):
-            if '//' in self.data[i]:
-                self.data[i] = self.data[i].split('//',1)[0] + '\n'
-        #remove white space and blank lines
-        self.data = ''.join(self.data)
-        self.data = self.data.replace('\t', ' ')
-        while '  ' in self.data:
-            self.data = self.data.replace('  ', ' ')
-        while '\n\n' in self.data:
-            self.data = self.data.replace('\n\n', '\n')
-
-        #join split strings
-        self.data = self.data.replace('" +\n"', '')
-        self.data = self.data.replace('" +\n "', '')
-        self.data = self.data.replace('"+\n"', '')
-        self.data = self.data.replace('"+\n "', '')
-        self.data = self.data.replace('" +\n', '"\n') #remove trailing string splits
-
-        #parse quotes
-        self._parseQuotes('"')
-        #parse brackets
-        self.data = FGD.parseNested(self.data, '[', ']')
-        #break at newlines again
-        self.data = FGD._breakNewlines(self.data)
-        
-        #process file
-        cursor = 0
-        while cursor < len(self.data):
-            if type(self.data[cursor]) != str:
-                raise IOError('Unexpected brackets')
-            line = self.data[cursor] 
-            line = line.split(' ')
-            if line[0] == '@include':
-                # parse included files
-                importPath = filepath.rsplit('/',1)[0]
-                importPath += '/' + self.stringDict[ line[1] ]
-                imported = FGD(importPath)
-                self.entities.update(imported.entities)
-            elif line[0].startswith('@mapsize'):
-                #this line defines the maximum map size this game uses
-                pass
-            elif line[0] in FGD.classTypes:
-                item = self.data[cursor]
-                cursor += 1
-                while type(self.data[cursor]) == str:
-                    item += self.data[cursor]
-                    cursor += 1
-                parameters = self.data[cursor]
-                parameters = [x for x in parameters if x != '']
-                #add class
-                self._addEntity( FGD.Entity(self, item, parameters) )
-            else:
-                raise IOError('Unrecognized line: ' + self.data[cursor])
-            cursor += 1
+            data = f.read()
+
+        FGD._Parser(data, filepath).parseFile(self)
+
+    ## INTERNAL! Single pass tokenizer and recursive descent parser for FGD
+    #  files.
+    #
+    #  The text is split into tokens by one regular expression. White space is
+    #  skipped and comments are dropped, but newlines are kept because they end
+    #  parameter definitions. Strings keep their quotes so they can be told
+    #  apart from words, and strings joined with + are one token.
+    class _Parser:
+
+        # Comments match without a group, so they are found as empty strings.
+        _TOKEN = re.compile(r'''
+            //[^\n]*
+            | ( "[^"]*"(?:[ \t]*\+\s*"[^"]*")*(?:[ \t]*\+)?
+            | "
+            | \n
+            | [\[\]():=,]
+            | [^\s"\[\]():=,/]+(?:/[^\s"\[\]():=,/]+)*
+            )
+            ''', re.VERBOSE)
+        _STRING = re.compile(r'"([^"]*)"')
+        _SYMBOLS = frozenset(['\n', '[', ']', '(', ')', ':', '=', ','])
+
+        ## constructor. Tokenizes the text.
+        #
+        #  @param data text of FGD file
+        #  @param filepath path of FGD file, used for includes and error
+        #  messages
+        def __init__(self, data, filepath):
+            ## path of FGD file
+            self.filepath = filepath
+            ## list of tokens. It is padded with None so looking ahead never
+            #  runs past the end.
+            self.tokens = list(filter(None, FGD._Parser._TOKEN.findall(data)))
+            self.tokens += [None] * 4
+            ## index of next token
+            self.cursor = 0
+            if '"' in self.tokens:
+                self.cursor = self.tokens.index('"')
+                self.error('quote left open')
+
+        ## raise an IOError naming the file and line of the next token
+        #
+        #  @param message description of error
+        def error(self, message):
+            line = self.tokens[:self.cursor].count('\n') + 1
+            raise IOError('%s in %s line %d' % (message, self.filepath, line))
+
+        ## True if token is a quoted string
+        @staticmethod
+        def isString(token):
+            return token != None and token[0] == '"'
+
+        ## True if token is an unquoted word, such as a name, type or number
+        @staticmethod
+        def isWord(token):
+            return token != None and token[0] != '"' and token not in FGD._Parser._SYMBOLS
+
+        ## get text of a string or word
+        @staticmethod
+        def text(token):
+            if token[0] != '"':
+                return token
+            if token[-1] == '"' and token.count('"') == 2:
+                return token[1:-1]
+            return ''.join(FGD._Parser._STRING.findall(token))
+
+        ## next token, or None at end of file
+        def peek(self):
+            return self.tokens[self.cursor]
+
+        ## get next token
+        #
+        #  @param expected expected token. An error is raised if the token
+        #  differs.
+        def next(self, expected=None):
+            token = self.tokens[self.cursor]
+            if token == None:
+                self.error('unexpected end of file')
+            if expected != None and token != expected:
+                self.error('expected "%s" but found "%s"' % (expected, token))
+            self.cursor += 1
+            return token
+
+        ## get next word
+        def word(self):
+            token = self.next()
+            if not FGD._Parser.isWord(token):
+                self.error('expected a word but found "%s"' % token)
+            return token
+
+        ## get next string or word
+        def value(self):
+            token = self.next()
+            if token in FGD._Parser._SYMBOLS:
+                self.error('unexpected "%s"' % token)
+            return token
+
+        ## skip newline tokens
+        def skipNewlines(self):
+            tokens = self.tokens
+            while tokens[self.cursor] == '\n':
+                self.cursor += 1
+
+        ## skip a bracketed block, including nested blocks
+        #
+        #  @param start opening bracket
+        #  @param end closing bracket
+        def skipBlock(self, start, end):
+            if self.peek() != start:
+                self.next(start) #raises error
+            # jump from one end bracket to the next, counting start brackets
+            # in between
+            tokens = self.tokens
+            depth = 0
+            while True:
+                try:
+                    close = tokens.index(end, self.cursor)
+                except ValueError:
+                    self.cursor = len(tokens) - 1
+                    self.error('unexpected end of file')
+                depth += tokens[self.cursor:close].count(start) - 1
+                self.cursor = close + 1
+                if depth <= 0:
+                    break
+
+        ## parse the whole file into an FGD object
+        #
+        #  @param fgd FGD object to add entities to
+        def parseFile(self, fgd):
+            while True:
+                self.skipNewlines()
+                if self.peek() == None:
+                    break
+                token = self.word()
+                if token == '@include':
+                    # parse included files
+                    importPath = self.filepath.rsplit('/',1)[0]
+                    importPath += '/' + FGD._Parser.text(self.value())
+                    fgd._addInclude(importPath)
+                elif token.startswith('@mapsize'):
+                    #this line defines the maximum map size this game uses
+                    self.skipBlock('(', ')')
+                elif token in ('@MaterialExclusion', '@AutoVisGroup'):
+                    #not classes, and not used here
+                    while self.peek() != '[':
+                        self.next()
+                    self.skipBlock('[', ']')
+                elif token in FGD.classTypes:
+                    fgd._addEntity(self.parseClass(fgd, token))
+                else:
+                    self.cursor -= 1
+                    self.error('Unrecognized line: ' + token)
+
+        ## parse a class header, after its class type. The body is skipped,
+        #  to be parsed by parseBody() when the class is first used.
+        #
+        #  @param fgd FGD object the class belongs to
+        #  @param classType class type, such as '@PointClass'
+        #  @return FGD._LazyEntity
+        def parseClass(self, fgd, classType):
+            #parse hammer display properties
+            display = []
+            while True:
+                self.skipNewlines()
+                if self.peek() == '=':
+                    break
+                prop = self.word()
+                self.skipNewlines()
+                if self.peek() == '(':
+                    display.append([prop, self.parseArguments()])
+                else:
+                    display.append([prop, None])
+            self.next('=')
+            #parse name and description
+            self.skipNewlines()
+            name = self.word()
+            description = None
+            self.skipNewlines()
+            if self.peek() == ':':
+                self.cursor += 1
+                self.skipNewlines()
+                description = FGD._Parser.text(self.value())
+            #find parameters
+            self.skipNewlines()
+            start = self.cursor
+            self.skipBlock('[', ']')
+            return FGD._LazyEntity(fgd, classType, name, description, display, self, start)
+
+        ## parse a class body
+        #
+        #  @return list of parameter tuples, see parseParameter()
+        def parseBody(self):
+            tokens = self.tokens
+            parameters = []
+            self.next('[')
+            while True:
+                while tokens[self.cursor] == '\n':
+                    self.cursor += 1
+                if tokens[self.cursor] == ']':
+                    self.cursor += 1
+                    break
+                parameters.append(self.parseParameter())
+            return parameters
+
+        ## parse the bracketed arguments of a Hammer display property
+        #
+        #  @return list of arguments, split at commas
+        def parseArguments(self):
+            self.next('(')
+            arguments = []
+            words = []
+            while True:
+                token = self.next()
+                if token == ')' or token == ',':
+                    if words or token == ',' or arguments:
+                        arguments.append(' '.join(words))
+                    words = []
+                    if token == ')':
+                        return arguments
+                elif token not in FGD._Parser._SYMBOLS:
+                    words.append(FGD._Parser.text(token))
+                elif token != '\n':
+                    self.error('unexpected "%s"' % token)
+
+        ## parse a parameter, input or output definition
+        #
+        #  @return (kind, name, value type, default, short description,
+        #  long description, choices) tuple. kind is 'input', 'output' or None
+        def parseParameter(self):
+            tokens = self.tokens
+            isWord = FGD._Parser.isWord
+            kind = None
+            name = self.word().lower()
+            if name in ('input', 'output') and isWord(tokens[self.cursor]):
+                kind = name
+                name = self.next().lower()
+            i = self.cursor
+            if tokens[i] != '(' or not isWord(tokens[i + 1]) or tokens[i + 2] != ')':
+                self.error('expected "(type)" after "%s"' % name)
+            valueType = tokens[i + 1].lower()
+            self.cursor += 3
+            while isWord(tokens[self.cursor]):
+                self.cursor += 1 #readonly, report
+            
+            values = [None, None, None]
+            count = 0
+            while tokens[self.cursor] == ':':
+                token = tokens[self.cursor + 1]
+                if token == None or token in FGD._Parser._SYMBOLS:
+                    self.cursor += 1
+                else:
+                    if count < 3:
+                        values[count] = token
+                    self.cursor += 2
+                count += 1
+            text = FGD._Parser.text
+            shortDescription = values[0] and text(values[0])
+            default = values[1] and text(values[1])
+            longDescription = values[2] and text(values[2])
+            if default != None and values[1][0] != '"':
+                try:
+                    default = str(int(default))
+                except ValueError:
+                    pass
+            
+            choices = None
+            if tokens[self.cursor] == '=':
+                self.cursor += 1
+                self.skipNewlines()
+                choices, flagDefault = self.parseChoices()
+                if valueType == 'flags':
+                    default = str(flagDefault)
+            return kind, name, valueType, default, shortDescription, longDescription, choices
+
+        ## parse the bracketed options of a choices or flags parameter
+        #
+        #  @return (choices, flags default) tuple. The flags default is the
+        #  sum of the flags that are on by default.
+        def parseChoices(self):
+            self.next('[')
+            choices = dict()
+            flagDefault = 0
+            while True:
+                self.skipNewlines()
+                if self.peek() == ']':
+                    self.cursor += 1
+                    return choices, flagDefault
+                line = [self.value()]
+                while self.peek() == ':':
+                    self.cursor += 1
+                    line.append(self.value())
+                if len(line) < 2:
+                    self.error('expected ":"')
+                key, value = [FGD._Parser.convertChoice(x) for x in line[:2]]
+                if len(line) >= 3 and FGD._Parser.text(line[2]) == '1':
+                    flagDefault += int(key)
+                choices[key] = value
+
+        ## Get text of a choice key or value. Unquoted numbers are turned
+        #  into integers.
+        @staticmethod
+        def convertChoice(token):
+            if token[0] != '"':
+                try:
+                    return int(token)
+                except ValueError:
+                    pass
+            return FGD._Parser.text(token)
+
+    ## INTERNAL! Class whose header has been read but whose body has not
+    #  been parsed yet.
+    class _LazyEntity:
+
+        ## Constructor
+        #
+        #  @param parent FGD file that contains this entity
+        #  @param classType type of class, such as '@PointClass'
+        #  @param name name of entity
+        #  @param description description of entity, or None
+        #  @param display list of Hammer display properties, see FGD.Entity
+        #  @param parser FGD._Parser of the file
+        #  @param start index of the token opening the class body
+        def __init__(self, parent, classType, name, description, display, parser, start):
+            ## FGD file that contains this entity
+            self.parent = parent
+            ## type of entity
+            self.type = classType
+            ## name of entity
+            self.name = name
+            ## description of entity
+            self.description = description
+            ## list of Hammer display elements
+            self.display = display
+            #  parser and position of class body
+            self._parser = parser
+            self._start = start
+            #  parsed FGD.Entity, shared by every FGD that includes this class
+            self._entity = None
+
+        ## The FGD file and parsed entity are not saved in the disk cache
+        def __getstate__(self):
+            state = dict(self.__dict__)
+            state['parent'] = None
+            state['_entity'] = None
+            return state
+
+        ## Parse the class body, and the classes named via base(), if not
+        #  done already.
+        #
+        #  @return FGD.Entity
+        def load(self):
+            if self._entity == None:
+                self._parser.cursor = self._start
+                parameters = self._parser.parseBody()
+                self._entity = FGD.Entity(self.parent, self.type, self.name, self.description, self.display, parameters)
+            return self._entity
+
+    ## INTERNAL! Class stored in a memory mapped snapshot file that has not
+    #  been read yet. See FGD.fromSnapshot().
+    class _SnapshotEntity:
+
+        ## Constructor
+        #
+        #  @param parent FGD object the snapshot was opened as
+        #  @param snapshot memory mapped snapshot file
+        #  @param offset position of the pickled FGD.Entity
+        #  @param length size of the pickled FGD.Entity
+        def __init__(self, parent, snapshot, offset, length):
+            ## FGD object the snapshot was opened as
+            self.parent = parent
+            self._snapshot = snapshot
+            self._offset = offset
+            self._length = length
+
+        ## Read the class from the snapshot.
+        #
+        #  @return FGD.Entity
+        def load(self):
+            entity = pickle.loads(self._snapshot[self._offset:self._offset + self._length])
+            entity.parent = self.parent
+            return entity
 
     ## Container for information about class parameters, inputs, and outputs
     # @todo clean and improve code, fix nonsensical elements of parsing strategy
@@ -392,19 +935,27 @@ class FGD:
         ## Constructor
         #
         #  @param parent FGD file that contains this entity
-        #  @param classLine first line of class definition
-        #  @param parameters contents of bracketed section defining class parameters, inputs, and outputs
-        def __init__(self, parent, classLine, parameters):
+        #  @param classType type of class, such as '@PointClass'
+        #  @param name name of entity
+        #  @param description description of entity, or None
+        #  @param display list of [property, arguments] Hammer display
+        #  properties. arguments is a list of strings, or None if the property
+        #  has no brackets.
+        #  @param parameters list of (kind, name, value type, default, short
+        #  description, long description, choices) tuples defining class
+        #  parameters, inputs, and outputs. kind is 'input', 'output' or None.
+        def __init__(self, parent, classType, name, description, display, parameters):
             ## FGD file that contains this entity
             self.parent = parent
             ## name of entity
-            self.name = None
+            self.name = name
             ## type of entity
-            self.type = None
+            self.type = classType
+            assert self.type in FGD.classTypes
             ## description of entity
-            self.description = None
+            self.description = description
             ## list of Hammer display elements
-            self.display = []
+            self.display = display
             ## list of entity member variables that can be set
             #these are only dicts while parsing, at the end they are only lists
             #this forces uniqueness of parameters, and overwrites upon duplication
@@ -414,119 +965,12 @@ class FGD:
             ## list of entity outputs
             self.outputs = {}
 
-            #parse classLine
-            #parse description
-            data = classLine.split(':')
-            assert len(data) <= 2
-            if len(data) == 2:
-                self.description = data[1]
-            #parse name
-            data = data[0].split('=')
-            data = [x.strip() for x in data]
-            assert len(data) == 2
-            self.name = data[1]
-            #parse hammer display properties
-            data = FGD.parseNested(data[0], '(', ')')
-            data[0] = data[0].split(' ')
-            self.type = data[0][0]
-            assert self.type in FGD.classTypes
-            data[0] = ' '.join(data[0][1:])
-            #split grouped properties
-            cursor = 0
-            while cursor < len(data):
-                if type(data[cursor]) == str:
-                    replacement = data[cursor].split(' ')
-                    data.pop(cursor)
-                    data = data[:cursor] + replacement + data[cursor:]
-                    cursor += len(replacement)
-                cursor += 1
-            data = [x for x in data if x != ''] #remove blank strings
-            cursor = 0
-            while cursor < len(data):
-                prop = data[cursor]
-                if not type(prop) == str:
-                    raise Exception()
-                prop = prop.strip()
+            for prop, arguments in self.display:
                 if not prop in FGD.properties:
                     raise Exception('unrecognized entity property')
-                if prop == 'halfgridsnap':
-                    self.display.append([prop, None])
-                    cursor += 1
-                else:
-                    self.display.append([prop, data[cursor+1]])
-                    cursor += 2
-
-            #inherit classes named via base()
-            for e in self.display:
-                if e[0] == 'base':
-                    bases = [x.strip() for x in e[1][0].split(',')] #get list of classes to inherit from
-                    for base in bases:
-                        base = self.parent.entities[base]
-                        for param in base.parameters:
-                            self.parameters[param.name] = param
-                        for param in base.inputs:
-                            self.inputs[param.name] = param
-                        for param in base.outputs:
-                            self.outputs[param.name] = param
-            
-            #parse parameters
-            cursor = 0
-            while cursor < len(parameters):
-                data = parameters[cursor].lower()
-                if data.endswith('='):
-                    data = data[:-1]
-                data = data.split(':')
-                data = [x.strip() for x in data]
-                data[0] = FGD.parseNested(data[0], '(', ')')
-                data[0][0] = data[0][0].split(' ')
-
-                kind = None
-                if data[0][0][0] in ['input','output']:
-                    kind = data[0][0][0]
-                    data[0][0] = data[0][0][1:]
-                name = data[0][0][0]
-                valueType = data[0][1][0].strip().lower()
-                shortDescription = None
-                longDescription = None
-                default = None
-                choices = None
-                if len(data) >= 2:
-                    shortDescription = parent.stringDict[ data[1] ]
-                if len(data) >= 3 and data[2] != "":
-                    try:
-                        default = str(int(data[2]))
-                    except:
-                        default = parent.stringDict[ data[2] ]
-                if len(data) >= 4 and data[3] != "":
-                    longDescription = parent.stringDict[ data[3] ]
-                if valueType == 'choices' or valueType == 'flags':
-                    if valueType == 'flags':
-                        flagDefault = 0
-                    
-                    #look for options, which come after the '='
-                    while not parameters[cursor].endswith('='):
-                        cursor += 1
-                    cursor += 1
-                    temp = [x for x in parameters[cursor] if x != '']
-                    choices = dict()
-                    for line in temp:
-                        line = [x.strip() for x in line.split(':')]
-                        try:
-                            line[0] = int(line[0])
-                        except:
-                            line[0] = parent.stringDict[ line[0] ]
-                        try:
-                            line[1] = int(line[1])
-                        except:
-                            line[1] = parent.stringDict[ line[1] ]
-                        if valueType == 'flags':
-                            if line[2] == '1':
-                                flagDefault += int(line[0])
-                        choices[line[0]] = line[1]
-                    
-                    if valueType == 'flags':
-                        default = str(flagDefault)
 
+            #add parameters
+            for kind, name, valueType, default, shortDescription, longDescription, choices in parameters:
                 try:
                     valueType = self._convertType(valueType)
                     default = self._parseDefault(valueType, default, choices)
@@ -543,13 +987,30 @@ class FGD:
                 except Exception as e:
                     print("Exception", e)
                     print("|".join([str(x) for x in [valueType, default, choices, shortDescription, longDescription]]))
-                cursor += 1
             
-            #convert inputs, outputs, parameters into lists
-            self.inputs = self.inputs.values()
-            self.outputs = self.outputs.values()
-            self.parameters = self.parameters.values()
+            #inherit classes named via base(). Lists that the class adds
+            #nothing to are shared with other classes that have the same bases
+            bases = []
+            for prop, arguments in self.display:
+                if prop == 'base':
+                    bases += arguments
+            inherited = self.parent._getInherited(tuple(bases))
+            groups = [self.parameters, self.inputs, self.outputs]
+            for i in range(len(groups)):
+                if groups[i]:
+                    merged = dict(inherited[i][0])
+                    merged.update(groups[i])
+                    groups[i] = list(merged.values())
+                else:
+                    groups[i] = inherited[i][1]
+            self.parameters, self.inputs, self.outputs = groups
         
+        ## The containing FGD file is not saved in snapshots
+        def __getstate__(self):
+            state = dict(self.__dict__)
+            state['parent'] = None
+            return state
+
         def _convertType(self, _type):
             for conversionType in FGD._CONVERSION.keys():
                 if _type in FGD._CONVERSION[conversionType]:
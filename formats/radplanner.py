@@ -0,0 +1,114 @@
+## Chooses vrad options that light a set of maps within a time budget.
+#
+#  The time vrad takes is estimated from the content of each map:
+#  - luxels: the lightmapped area of every face divided by the square of its
+#    lightmap scale. Faces with tool materials have no lightmap, and only the
+#    displaced faces of a displacement brush are kept by vbsp.
+#  - light entities: every luxel is tested against every light.
+#  - displacements: these are lit with extra samples.
+#
+#  The costs are rough averages measured on a single core. Use
+#  RADPlanner.scale to correct them for a particular machine.
+class RADPlanner(object):
+
+    ## entity classes that are baked into lightmaps
+    lightClasses = ('light', 'light_spot', 'light_environment')
+
+    ## vrad options, from the best lighting to the fastest, as
+    #  (fast, bounce limit, extrasky, no supersampling)
+    presets = [
+        (False, None, 16, False),
+        (False, None, None, False),
+        (False, 8, None, False),
+        (False, 8, None, True),
+        (True, 4, None, True),
+        (True, 1, None, True)
+        ]
+
+    ## seconds per luxel for direct lighting, plus luxelLightCost per light
+    luxelCost = 2e-6
+    ## seconds per luxel for each light
+    luxelLightCost = 1e-6
+    ## seconds per luxel for each light bounce
+    bounceCost = 1e-6
+    ## seconds per luxel for each sky sample pass, if the map has a sun
+    skyCost = 4e-6
+    ## seconds per displacement
+    displacementCost = 0.05
+    ## direct lighting time is multiplied by this with supersampling
+    superSampleFactor = 2.0
+    ## direct lighting time is multiplied by this with -fast
+    fastFactor = 0.3
+    ## bounces vrad typically needs before it stops on its own
+    typicalBounces = 10
+
+    ## Constructor
+    def __init__(self):
+        ## multiplies every estimate, to correct the costs for a machine
+        self.scale = 1.0
+
+    ## Measure what vrad's time depends on in a map
+    #
+    #  @param vmf VMF instance
+    #  @return (luxels, lights, displacements, has sun)
+    @staticmethod
+    def measure(vmf):
+        vmf.buildGeometry()
+        solids = list(vmf.solids)
+        for entity in vmf.entities:
+            solids.extend(entity.solids)
+        luxels = 0.0
+        displacements = 0
+        for solid in solids:
+            sides = [x for x in solid.sides if x.power > 0]
+            displacements += len(sides)
+            if len(sides) == 0:
+                sides = solid.sides
+            for side in sides:
+                if side.material.lower().startswith('tools/'):
+                    continue
+                luxels += side.area()/(side.lightmapScale*side.lightmapScale)
+        classnames = [x.classname for x in vmf.entities]
+        lights = len([x for x in classnames if x in RADPlanner.lightClasses])
+        return luxels, lights, displacements, 'light_environment' in classnames
+
+    ## Estimate how long vrad will take to light maps
+    #
+    #  @param measures list of RADPlanner.measure() results, one per map
+    #  @param preset one of RADPlanner.presets
+    #  @param cores number of processor cores vrad can use
+    #  @return estimated wall-clock seconds
+    def estimate(self, measures, preset, cores = 1):
+        fast, bounce, extraSky, noSuperSampling = preset
+        bounces = RADPlanner.typicalBounces
+        if bounce != None:
+            bounces = min(bounce, bounces)
+        seconds = 0.0
+        for luxels, lights, displacements, sun in measures:
+            direct = luxels*(RADPlanner.luxelCost + RADPlanner.luxelLightCost*lights)
+            direct += displacements*RADPlanner.displacementCost
+            if not noSuperSampling:
+                direct *= RADPlanner.superSampleFactor
+            if fast:
+                direct *= RADPlanner.fastFactor
+            seconds += direct + luxels*RADPlanner.bounceCost*bounces
+            if sun:
+                seconds += luxels*RADPlanner.skyCost*(extraSky or 1)
+        return seconds*self.scale/max(1, cores)
+
+    ## Choose the best vrad options that are estimated to finish in time
+    #
+    #  If none do, the fastest options are chosen.
+    #
+    #  @param vmfs list of VMF instances to be lit
+    #  @param seconds wall-clock seconds lighting may take
+    #  @param cores number of processor cores vrad can use
+    #  @return (preset, estimated seconds). The preset is one of
+    #  RADPlanner.presets.
+    def plan(self, vmfs, seconds, cores = 1):
+        measures = [RADPlanner.measure(x) for x in vmfs]
+        for preset in RADPlanner.presets:
+            estimate = self.estimate(measures, preset, cores)
+            if estimate <= seconds:
+                break
+        return preset, estimate
@@ -1,13 +1,19 @@
-import os, shutil, subprocess, time, sys
+import os, shutil, subprocess, sys, shlex, threading, multiprocessing
 if sys.version_info.major == 2:
     #for Python 2.x
     from Tkinter import *
+    from Queue import Queue, Empty
 else:
     #for Python 3.x
     from tkinter import *
+    from queue import Queue, Empty
 
 from formats.executor import Executor
 from formats.sdkutil import SDKUtil
+from formats.sdkprogress import SDKProgress
+from formats.radplanner import RADPlanner
+import formats.vmf
+from formats.fgd import FGD
 from configgui import ConfigGUI
 from gameids import *
 
@@ -101,6 +107,17 @@ class SDKExecutor(Executor):
         GMOD    : '4000'
         }
 
+    ## most bytes of compile utility output read at once
+    _readSize = 65536
+
+    ## share of a map's compile time each compile utility typically takes,
+    #  used to weight progress
+    _toolWeights = {
+        'vbsp'  : 0.1,
+        'vvis'  : 0.2,
+        'vrad'  : 0.65
+        }
+
     ## Check for software needed to work with format
     #
     @staticmethod
@@ -113,6 +130,13 @@ class SDKExecutor(Executor):
     @staticmethod
     def usableGames():
         return SDKUtil.checkGames()
+
+    ## Forget the games found, so they are looked for again
+    #
+    #  @sa Executor.clearCache
+    @staticmethod
+    def clearCache():
+        SDKUtil.clearCache()
     
     ## Constructor
     #
@@ -134,6 +158,12 @@ class SDKExecutor(Executor):
         self.low = False
         ## Enable verbose compilation command line output
         self.verbose = False
+        ## Number of processor cores compilation may use at once. Several maps
+        #  are compiled at the same time when this allows.
+        self.cores = multiprocessing.cpu_count()
+        ## list of (map path, utility, phase, seconds) for every phase of the
+        #  compile utilities run by the last compile
+        self.phaseTimes = []
         
         #BSP parameters
         ## Custom argument list
@@ -174,6 +204,12 @@ class SDKExecutor(Executor):
         self.softSun = None
         ## Skip light supersampling
         self.noSuperSampling = False
+        ## Wall-clock seconds lighting may take, or None. If set, compile()
+        #  chooses fastRad, limitBounce, extraSky and noSuperSampling to fit,
+        #  using planRAD().
+        self.radTimeBudget = None
+        ## RADPlanner used by planRAD()
+        self.radPlanner = RADPlanner()
 
         #game parameters
         ## Custom argument list
@@ -193,6 +229,17 @@ class SDKExecutor(Executor):
         ## game directory
         self.gamePath = SDKUtil.findGamePath(gameID)
 
+    ## Load the game's FGD and look up the games and SDK paths, so they are
+    #  ready when the map is generated and compiled.
+    #
+    #  @sa Executor.preload
+    def preload(self):
+        SDKUtil.checkGames()
+        try:
+            FGD.getGameFGD(self.getGameID())
+        except NotImplementedError:
+            pass #no FGD for this game yet
+
     ## Set compilation quality.
     #
     #  @param quality integer ranging from 0-3 inclusive.
@@ -237,12 +284,38 @@ class SDKExecutor(Executor):
         self.presetNormal()
         self.extraSky = 16 #1 is normal, 16 is equal to '-final'
 
+    ## Choose vrad options that light the maps within a time budget
+    #
+    #  Sets fastRad, limitBounce, extraSky and noSuperSampling to the best
+    #  options RADPlanner expects to finish in time, or the fastest ones if
+    #  none do.
+    #
+    #  @param seconds wall-clock seconds lighting may take
+    #  @param vmfs optional list of VMF instances of the maps. If not given,
+    #  the maps given to setMapList() are used, or the map files are loaded if
+    #  there are none.
+    #  @return estimated seconds lighting will take
+    def planRAD(self, seconds, vmfs = None):
+        if vmfs == None and self._maps != None:
+            vmfs = [x.getNative() for x in self._maps]
+        if vmfs == None:
+            vmfs = [formats.vmf.VMF(self._gameID, x) for x in self._mapList]
+        cores = max(1, self.cores)
+        preset, estimate = self.radPlanner.plan(vmfs, seconds, cores)
+        self.fastRad, self.limitBounce, self.extraSky, self.noSuperSampling = preset
+        self.listenerWrite(
+            'Lighting estimated to take %i seconds of %i allowed\n\n' % (estimate, seconds)
+            )
+        return estimate
+
     ## Set map list.
     #
     #  @param mapList a list of paths to uncompiled map files. The first map in
     #  the list is the map that is loaded in the game or editor, if any.
-    def setMapList(self, mapList):
-        Executor.setMapList(self, mapList)
+    #  @param maps optional list of the VMFMap objects the files were saved
+    #  from. planRAD() measures these instead of loading the files.
+    def setMapList(self, mapList, maps = None):
+        Executor.setMapList(self, mapList, maps)
         ## list of compiled map files
         self._bspList = [x[:-3]+'bsp' for x in self._mapList]
         if not all(map(os.path.isfile, self._bspList)):
@@ -290,21 +363,31 @@ class SDKExecutor(Executor):
     ## Compile a set of maps.
     #
     #  The maps will be compiled and installed for the specified game, using the
-    #  specified quality setting.
+    #  specified quality setting. Each map is compiled by its own
+    #  vbsp, vvis, vrad chain, and the chains of different maps run at the same
+    #  time as far as SDKExecutor.cores allows.
     def compile(self, custom = False):
         if self._mapList == None or len(self._mapList) <= 0:
             raise Exception("No maps specified")
-        self._setMetaProgress(0.0, 0.1)
-        self._setMetaStatus("Converting to BSP")
-        self.runBSP(custom)
+        if self.radTimeBudget != None and self.doRAD and not custom:
+            try:
+                self.planRAD(self.radTimeBudget)
+            except Exception as e:
+                #not knowing how long lighting takes is no reason to fail
+                self.listenerWrite(
+                    'Could not plan lighting, using current settings: ' + str(e) + '\n\n'
+                    )
+        self._setMetaProgress(0.0, 0.95)
+        self._setMetaStatus("Compiling")
+        self.phaseTimes = []
+        steps = [('vbsp', self._bspArguments(custom))]
         if self.doVIS or custom:
-            self._setMetaProgress(0.1, 0.2)
-            self._setMetaStatus("Optimizing Visibility")
-            self.runVIS(custom)
+            steps.append(('vvis', self._visArguments(custom)))
         if self.doRAD or custom:
-            self._setMetaProgress(0.3, 0.65)
-            self._setMetaStatus("Lighting")
-            self.runRAD(custom)
+            steps.append(('vrad', self._radArguments(custom)))
+        self._runCompileChains(steps)
+        #only reaches this if no exceptions (compile succeeds)
+        self._bspList = [x[:-3]+'bsp' for x in self._mapList]
         self._setMetaProgress(0.95, 0.05)
         self._setMetaStatus("Installing Map in Game")
         self.installMap()
@@ -336,67 +419,230 @@ class SDKExecutor(Executor):
     def _setSubStatus(self, status):
         self.setStatus(self._metaStatus+status)
 
-    ## run a compile utility on the map with specified arguments
+    ## Build the command line that runs a compile utility on one map
     #
-    #  Behavior is only defined for vbsp.exe, vvis.exe, and vrad.exe
-    def _runCompileUtility(self, name, arguments):
+    #  @param name name of compile utility, such as 'vbsp'
+    #  @param arguments list of argument strings
+    #  @param mapPath path of map file to compile
+    #  @return command line string
+    def _compileCommand(self, name, arguments, mapPath):
         command = ['"' + self._hammerPath + '/bin/' + name + '.exe"']
+        command.extend(arguments)
         if self.verbose:
-            arguments.append('-verbose')
+            command.append('-verbose')
         if self.low:
-            arguments.append('-low')
-        command.extend(arguments)
+            command.append('-low')
         command.append('-game "' + self.gamePath + '"')
-        command = [(command + ['"' + x + '"']) for x in self._mapList]
-        command = [' '.join(x) for x in command]
+        command.append('"' + mapPath + '"')
+        return ' '.join(command)
 
-        oldworkdir = os.getcwd()
-        os.chdir(self._hammerPath) #VBSP needs this to find the materials
-
-        result = [None]*len(command)
-        for line in range(len(command)):
-            self.listenerWrite(command[line]+'\n\n')
-            if len(command)>1:
-                self._setSubProgress(float(line)/len(command))
-                self._setSubStatus(': Map ' + str(line+1) + '/' + str(len(command)))
+    ## Start a compile utility, with its output piped back
+    #
+    #  The utility runs in the hammer directory, because VBSP needs this to find
+    #  the materials.
+    #
+    #  @param command command line from _compileCommand()
+    #  @return subprocess.Popen
+    def _startCompileUtility(self, command):
+        if os.name == 'nt':
             #change startupinfo to suppress window
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            process = subprocess.Popen(
-                command[line],
+            return subprocess.Popen(
+                command,
+                cwd = self._hammerPath,
                 startupinfo = startupinfo,
                 stderr = subprocess.STDOUT,
                 stdout = subprocess.PIPE
                 )
+        #everywhere else the command line has to be split into arguments
+        return subprocess.Popen(
+            shlex.split(command),
+            cwd = self._hammerPath,
+            stderr = subprocess.STDOUT,
+            stdout = subprocess.PIPE
+            )
+
+    ## Read the output of a compile utility until it exits
+    #
+    #  Runs on its own thread, one per process, blocking until output arrives.
+    #  Each read takes whatever is in the pipe, up to _readSize bytes. The
+    #  output and finally the return code are put in the queue as (key, bytes)
+    #  and (key, int).
+    #
+    #  A thread is used rather than selectors or asyncio pipes, because
+    #  selectors can't wait on pipes on Windows, and asyncio subprocesses need
+    #  an argument list rather than the command line the SDK tools are given.
+    @staticmethod
+    def _readCompileUtility(process, key, events):
+        fd = process.stdout.fileno()
+        while True:
+            data = os.read(fd, SDKExecutor._readSize)
+            if not data:
+                break
+            events.put((key, data))
+        process.stdout.close()
+        events.put((key, process.wait()))
+
+    ## Wait for the next batch of compile utility output
+    #
+    #  Waits for one event, checking regularly so an abort can arrive, then
+    #  takes every other event that is already waiting.
+    #
+    #  @return list of events from _readCompileUtility()
+    @staticmethod
+    def _waitCompileEvents(events):
+        while True:
+            try:
+                batch = [events.get(timeout = 0.05)]
+                break
+            except Empty:
+                pass
+        while True:
             try:
-                if len(self.listeners)>0:
-                    while process.poll() == None:
-                        text = process.stdout.read(4)
-                        if sys.version_info.major == 3:
-                            text = str(text, 'ascii')
-                        while text != '':
-                            self.listenerWrite(text)
-                            text = process.stdout.read(4)
-                            if sys.version_info.major == 3:
-                                text = str(text, 'ascii')
-                        time.sleep(0.05) #~20fps
-                else:
-                    process.wait()
-            except SystemExit:
-                #this is raised by the GUI to abort generation/compilation
-                #however, we need to stop the external process, so we catch it
+                batch.append(events.get_nowait())
+            except Empty:
+                return batch
+
+    ## run compile utilities on every map, as a chain of steps per map
+    #
+    #  Each map's steps run in order, but the chains of different maps overlap,
+    #  so one map can be converted with vbsp while another is lit by vrad.
+    #  vbsp uses one core. vvis and vrad are given an equal share of
+    #  SDKExecutor.cores with -threads. A step only starts when its cores are
+    #  free, except that one step is always allowed to run. Earlier maps get
+    #  free cores first.
+    #
+    #  Progress and status within each utility are parsed from its output by
+    #  SDKProgress, and the time of each phase is added to
+    #  SDKExecutor.phaseTimes.
+    #
+    #  Behavior is only defined for vbsp.exe, vvis.exe, and vrad.exe
+    #
+    #  @param steps list of (name, arguments) run on each map, in order
+    #  @exception Exception a compile utility failed. Other running utilities
+    #  are stopped.
+    def _runCompileChains(self, steps):
+        maps = self._mapList
+        cores = max(1, self.cores)
+        threads = max(1, cores//min(len(maps), cores))
+        weights = [SDKExecutor._toolWeights.get(name, 1.0) for name, arguments in steps]
+        total = sum(weights)*len(maps)
+        finished = 0.0
+        nextStep = [0]*len(maps)
+        #map index -> (process, cores in use)
+        running = {}
+        free = cores
+        events = Queue()
+        #map index -> output after the last complete line
+        partial = {}
+        #map index -> SDKProgress of the running step
+        parsers = {}
+        lastStatus = None
+        try:
+            while True:
+                for n in range(len(maps)):
+                    if n in running or nextStep[n] >= len(steps):
+                        continue
+                    name, arguments = steps[nextStep[n]]
+                    cost = 1
+                    if name in ('vvis', 'vrad'):
+                        cost = threads
+                        if not '-threads' in ' '.join(arguments):
+                            arguments = arguments + ['-threads ' + str(threads)]
+                    if cost > free and len(running) > 0:
+                        continue
+                    command = self._compileCommand(name, arguments, maps[n])
+                    self.listenerWrite(command+'\n\n')
+                    process = self._startCompileUtility(command)
+                    running[n] = (process, cost)
+                    free -= cost
+                    partial[n] = b''
+                    passes = 1
+                    if name == 'vrad' and '-both' in ' '.join(arguments).split():
+                        passes = 2 #LDR, then HDR
+                    parsers[n] = SDKProgress(name, passes)
+                    reader = threading.Thread(
+                        target = SDKExecutor._readCompileUtility,
+                        args = (process, n, events)
+                        )
+                    reader.daemon = True
+                    reader.start()
+                if len(running) == 0:
+                    break
+                status = []
+                progress = finished
+                for n in sorted(running):
+                    name = steps[nextStep[n]][0]
+                    if len(maps) > 1:
+                        name += ' map %i/%i' % (n+1, len(maps))
+                    if parsers[n].phase != None:
+                        name += ' ' + parsers[n].phase
+                    status.append(name)
+                    progress += weights[nextStep[n]]*parsers[n].progress
+                status = ': ' + ', '.join(status)
+                if status != lastStatus:
+                    self._setSubStatus(status)
+                    lastStatus = status
+                self._setSubProgress(min(1.0, progress/total))
+
+                #forward complete lines to listeners, one write per batch
+                lines = []
+                exited = []
+                for n, data in SDKExecutor._waitCompileEvents(events):
+                    if type(data) == int:
+                        exited.append((n, data))
+                        if partial[n]:
+                            lines.append(partial[n] + b'\n')
+                            partial[n] = b''
+                        continue
+                    if sys.version_info.major == 3:
+                        parsers[n].feed(str(data, 'ascii', 'replace'))
+                    else:
+                        parsers[n].feed(data)
+                    data = partial[n] + data
+                    end = data.rfind(b'\n') + 1
+                    lines.append(data[:end])
+                    partial[n] = data[end:]
+                text = b''.join(lines)
+                if text:
+                    if sys.version_info.major == 3:
+                        text = str(text, 'ascii', 'replace')
+                    self.listenerWrite(text)
+
+                for n, returncode in exited:
+                    process, cost = running.pop(n)
+                    free += cost
+                    name = steps[nextStep[n]][0]
+                    parsers[n].close()
+                    for phase, seconds, reported in parsers[n].phases:
+                        self.phaseTimes.append((maps[n], name, phase, seconds))
+                    if returncode != 0:
+                        raise Exception(name + ' failed.')
+                    finished += weights[nextStep[n]]
+                    nextStep[n] += 1
+        except SystemExit:
+            #this is raised by the GUI to abort generation/compilation
+            #however, we need to stop the external processes, so we catch it
+            for process, cost in running.values():
                 process.kill()
-                print('killed external process')
-                raise SystemExit() #...and then pass it along
-            if process.returncode != 0:
-                raise Exception(name + ' failed.')
-            
-        os.chdir(oldworkdir) #restore working directory
+            print('killed external process')
+            raise SystemExit() #...and then pass it along
+        finally:
+            #stop whatever is still running after a failure
+            for process, cost in running.values():
+                if process.poll() == None:
+                    process.kill()
+
+    ## run a compile utility on every map with specified arguments
+    #
+    #  Behavior is only defined for vbsp.exe, vvis.exe, and vrad.exe
+    def _runCompileUtility(self, name, arguments):
+        self._runCompileChains([(name, arguments)])
 
-    ## run VBSP on the maps to compile them into .bsp map files
-    def runBSP(self, custom = False):
+    ## Get VBSP arguments for the current settings
+    def _bspArguments(self, custom = False):
         #https://developer.valvesoftware.com/wiki/VBSP
-        assert len(self._mapList) == len(self._bspList)
         arguments = []
         if custom:
             arguments = [self.customBSP]
@@ -409,12 +655,10 @@ class SDKExecutor(Executor):
                 arguments.append('-nodetail')
             if self.noWater:
                 arguments.append('-nowater')
-        self._runCompileUtility('vbsp', arguments)
-        #only reaches this if no bsp exceptions (compile succeeds)
-        self._bspList = [x[:-3]+'bsp' for x in self._mapList]
+        return arguments
 
-    ## Run VVIS on the maps to optimize visibility
-    def runVIS(self, custom = False):
+    ## Get VVIS arguments for the current settings
+    def _visArguments(self, custom = False):
         #https://developer.valvesoftware.com/wiki/VVIS
         arguments = []
         if custom:
@@ -425,10 +669,10 @@ class SDKExecutor(Executor):
             if self.fastPortals:
                 arguments.append('-nosort')
         arguments.append('-novconfig') #suppress gui on vproject errors
-        self._runCompileUtility('vvis', arguments)
-        
-    ## Run VRAD on the maps to light them
-    def runRAD(self, custom = False):
+        return arguments
+
+    ## Get VRAD arguments for the current settings
+    def _radArguments(self, custom = False):
         #https://developer.valvesoftware.com/wiki/VRAD
         arguments = []
         if custom:
@@ -450,7 +694,22 @@ class SDKExecutor(Executor):
                 arguments.append('-softsun ' + str(self.softSun))
             if self.noSuperSampling:
                 arguments.append('-noextra')
-        self._runCompileUtility('vrad', arguments)
+        return arguments
+
+    ## run VBSP on the maps to compile them into .bsp map files
+    def runBSP(self, custom = False):
+        assert len(self._mapList) == len(self._bspList)
+        self._runCompileUtility('vbsp', self._bspArguments(custom))
+        #only reaches this if no bsp exceptions (compile succeeds)
+        self._bspList = [x[:-3]+'bsp' for x in self._mapList]
+
+    ## Run VVIS on the maps to optimize visibility
+    def runVIS(self, custom = False):
+        self._runCompileUtility('vvis', self._visArguments(custom))
+        
+    ## Run VRAD on the maps to light them
+    def runRAD(self, custom = False):
+        self._runCompileUtility('vrad', self._radArguments(custom))
 
     ## Install maps in appropriate game directory
     #
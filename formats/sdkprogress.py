@@ -0,0 +1,130 @@
+import re, time
+
+## Follows the progress of an SDK compile utility by parsing its output.
+#
+#  vbsp, vvis and vrad print a header for each long phase of their work,
+#  followed by progress markers as the phase goes on, and the seconds it took:
+#
+#  BuildFacelights:  0...1...2...3...4...5...6...7...8...9...10 (12)
+#
+#  Output can be fed in chunks of any size, so the progress of a phase is
+#  known as soon as each marker is printed.
+#
+#  Some options make a utility repeat its phases, such as vrad -both, which
+#  lights the map for LDR and then again for HDR. A phase that has already
+#  been seen starts the next pass.
+class SDKProgress(object):
+
+    ## share of each utility's time that its phases typically take. Phases not
+    #  listed are timed but don't move the progress.
+    _phaseWeights = {
+        'vbsp'  : {
+            'ProcessBlock_Thread'   : 0.8,
+            'Displacement Alpha'    : 0.2
+            },
+        'vvis'  : {
+            'BasePortalVis'         : 0.1,
+            'PortalFlow'            : 0.9
+            },
+        'vrad'  : {
+            'BuildFacelights'       : 0.6,
+            'BuildVisLeafs'         : 0.2,
+            'FinalLightFace'        : 0.1,
+            'ThreadComputeLeafAmbient'          : 0.05,
+            'Computing static prop lighting'    : 0.05
+            }
+        }
+
+    ## phase header, "name:" followed by the first progress marker
+    _header = re.compile(r'^\s*([^:]+?)\s*:\s*0\.\.\.')
+
+    ## progress marker, with the dots that show it is complete
+    _marker = re.compile(r'(\d+)\.\.\.')
+
+    ## seconds reported at the end of a phase
+    _reported = re.compile(r'\.\.\.10\s*\((\d+)\)')
+
+    ## Constructor
+    #
+    #  @param name name of compile utility, such as 'vrad'
+    #  @param passes number of times the utility is expected to go through
+    #  its phases
+    #  @param clock function returning the current time in seconds
+    def __init__(self, name, passes = 1, clock = time.time):
+        ## phase weights of this utility
+        self._weights = SDKProgress._phaseWeights.get(name, {})
+        self._passes = passes
+        self._clock = clock
+        ## number of passes finished
+        self._pass = 0
+        ## names of the phases seen in this pass
+        self._seen = set()
+        ## output after the last newline
+        self._line = ''
+        ## time the current phase started
+        self._start = None
+        ## weight of phases already finished in this pass
+        self._finished = 0.0
+        ## name of the current phase, or None between phases
+        self.phase = None
+        ## Float between 0.0 and 1.0 inclusive. Estimated share of the
+        #  utility's work that is done. Never decreases.
+        self.progress = 0.0
+        ## list of (phase, seconds, reported seconds) for finished phases.
+        #  Reported seconds are the utility's own, or None if not printed.
+        self.phases = []
+
+    ## Parse more output
+    #
+    #  @param text string of any length
+    def feed(self, text):
+        lines = (self._line + text).split('\n')
+        self._line = lines.pop()
+        for line in lines:
+            self._parseLine(line, True)
+        self._parseLine(self._line, False)
+
+    ## Finish the phase in progress, if any. Call when the utility exits.
+    def close(self):
+        if self._line:
+            self._parseLine(self._line, True)
+            self._line = ''
+
+    ## Update the current phase from a line of output
+    #
+    #  @param line line of output, without newline
+    #  @param complete True if the whole line has been printed
+    def _parseLine(self, line, complete):
+        header = SDKProgress._header.match(line)
+        if header == None:
+            return
+        if self.phase == None:
+            self.phase = header.group(1)
+            self._start = self._clock()
+            if self.phase in self._seen:
+                self._pass += 1
+                self._finished = 0.0
+                self._seen = set()
+            self._seen.add(self.phase)
+        weight = self._weights.get(self.phase, 0.0)
+        markers = SDKProgress._marker.findall(line, header.end() - 4)
+        fraction = 0.0
+        if len(markers) > 0:
+            fraction = int(markers[-1])/10.0
+        if complete:
+            fraction = 1.0
+        self._setProgress(self._finished + weight*fraction)
+        if complete:
+            reported = SDKProgress._reported.search(line)
+            if reported != None:
+                reported = int(reported.group(1))
+            self.phases.append((self.phase, self._clock() - self._start, reported))
+            self._finished += weight
+            self.phase = None
+
+    ## Set progress, given the finished weight of phases in this pass
+    def _setProgress(self, progress):
+        total = sum(self._weights.values())
+        if total > 0:
+            progress = (self._pass + progress/total)/self._passes
+            self.progress = max(self.progress, min(1.0, progress))
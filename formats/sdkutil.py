@@ -44,12 +44,34 @@ class SDKUtil:
             os.path.isfile(hammerPath + '/bin/vrad.exe')
             ])
     
-    ## Check for needed game utilities
+    #  result of checkGames(), which is only worked out once
+    _games = None
+
+    ## Check for needed game utilities. The result is worked out once and
+    #  then reused.
     #
     #  @return list List of gameIDs that can be worked on
     #
     @staticmethod
     def checkGames():
+        games = SDKUtil._games
+        if games == None:
+            games = SDKUtil._findGames()
+            SDKUtil._games = games
+        return list(games)
+
+    ## Forget the result of checkGames(), so games are looked for again the
+    #  next time, such as after installing or removing a game.
+    @staticmethod
+    def clearCache():
+        SDKUtil._games = None
+
+    ## INTERNAL! Probe for compilation utilities and game directories
+    #
+    #  @return list List of gameIDs that can be worked on
+    #
+    @staticmethod
+    def _findGames():
         gamelist = []
         #check for compilation utilities
         userName, basePath = SDKUtil.findUserAndBasePath()
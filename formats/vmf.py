@@ -1,4 +1,5 @@
-import math, copy, re
+import math, copy, re, itertools, collections.abc
+import numpy
 import gameids
 from formats.fgd import FGD
 from formats.sdkutil import SDKUtil
@@ -123,6 +124,10 @@ class VMF:
         self.gameId = gameId
         self._currentId = 1
         self._prefabCounter = 0 # Counter for replacing '%i' with appropriate prefab number in prefabs
+        ## If True, Solid.transform() and Entity.transform() only record the
+        #  transformation. It is applied the next time the solid's sides or the
+        #  entity's properties are read, including when the map is saved.
+        self.deferTransforms = False
         if filename == None:
             self._setupEmptyMap()
         else:
@@ -277,6 +282,15 @@ class VMF:
 
     def _toKVL(self):
         vmfKVL = KeyValueList()
+
+        # Format all displacements in batches
+        sides = []
+        for solid in self.solids:
+            sides.extend(solid.sides)
+        for entity in self.entities:
+            for solid in entity.solids:
+                sides.extend(solid.sides)
+        displacementRows = Side.formatDisplacements(sides)
         
         versionInfoKVL = KeyValueList()
         versionInfoKVL.add("formatversion", str(VMF._FORMAT_VERSION))
@@ -298,11 +312,11 @@ class VMF:
         worldKVL.add("maxpropscreenwidth", str(self.maxPropScreenWidth))
         worldKVL.add("skyname", self.sky)
         for solid in self.solids:
-            worldKVL.add("solid", solid.toKVL())
+            worldKVL.add("solid", solid.toKVL(displacementRows))
         vmfKVL.add("world",worldKVL)
 
         for entity in self.entities:
-            vmfKVL.add("entity", entity.toKVL())
+            vmfKVL.add("entity", entity.toKVL(displacementRows))
 
         cordonKVL = KeyValueList()
         cordonKVL.add(
@@ -329,6 +343,15 @@ class VMF:
                 self._writeKVL(value, outputFile, indent + 1)
                 outputFile.write("\t" * indent + "}\n")
 
+    ## Calculate and cache the geometry of every solid in the map in one batch
+    #
+    #  @sa Solid.buildGeometry()
+    def buildGeometry(self):
+        solids = list(self.solids)
+        for entity in self.entities:
+            solids.extend(entity.solids)
+        Solid.buildGeometry(solids)
+
     ## provide a unique ID number for members of this VMF
     def generateId(self):
         self._currentId += 1
@@ -351,30 +374,36 @@ class VMF:
         newSolids = []
         for solid in prefab.solids:
             newSolids.append(solid.copy(self))
-        #transform solids
-        for solid in newSolids:
-            solid.transform(s, materialLock, materialScaleLock, [0,0,0])
-            solid.transform(r, materialLock, materialScaleLock, [0,0,0])
-            solid.transform(t, materialLock, materialScaleLock, [0,0,0])
         
         #copy entites
         newEntities = []
         for entity in prefab.entities:
             newEntities.append(entity.copy(self))
+        
+        #transform all solids, including those of entities, in one pass
+        solids = newSolids + [solid for entity in newEntities for solid in entity.solids]
+        Side.transformMany(
+            [side for solid in solids for side in solid.sides],
+            [s, r, t],
+            materialLock,
+            materialScaleLock,
+            [0,0,0]
+            )
+        for solid in solids:
+            solid.origin = t.transformVector([0,0,0])
             
         #transform entities
-        for entity in newEntities:
-            entity.transform(s, materialLock, materialScaleLock, [0,0,0])
-            entity.transform(r, materialLock, materialScaleLock, [0,0,0])
-            entity.transform(t, materialLock, materialScaleLock, [0,0,0])
+        for matrix in (s, r, t):
+            Entity._transformPropertiesMany(newEntities, matrix)
             
         #change names so they don't interfere
         for entity in newEntities:
             for key in entity.getPropertyNames():
-                if type(entity[key]) == str:
-                    entity[key] = entity[key].replace("&i", str(self._prefabCounter))
-            for outputName in entity.outputs.keys():
-                for output in entity.outputs[outputName]:
+                value = entity._getProperty(key)
+                if type(value) == str and "&i" in value:
+                    entity[key] = value.replace("&i", str(self._prefabCounter))
+            for outputName in entity._outputs.keys():
+                for output in entity._outputs[outputName]:
                     output.target = output.target.replace("&i", str(self._prefabCounter))
 
         self._prefabCounter += 1
@@ -418,8 +447,26 @@ class Solid:
 
         ## unique node ID
         self.id = parent.generateId()
-        ## list of Sides that define this solid
-        self.sides = []
+        #  list of Sides that define this solid, see sides
+        self._sides = []
+        #  transformations recorded while VMF.deferTransforms is set
+        self._pendingTransforms = []
+        #  cached geometry, see buildGeometry()
+        self._vertices = None
+        self._bounds = None
+
+    def _getSides(self):
+        if self._pendingTransforms:
+            self._applyPendingTransforms()
+        return self._sides
+
+    def _setSides(self, sides):
+        if self._pendingTransforms:
+            self._applyPendingTransforms()
+        self._sides = sides
+    ## list of Sides that define this solid. Any deferred transformations are
+    #  applied before the list is returned.
+    sides = property(fget=_getSides, fset=_setSides)
 
     ## Create a copy
     #
@@ -590,13 +637,132 @@ class Solid:
             size,
             material
             )
-        offsets = []
-        for row in heightMap:
-            offsets.append([[0,0,z-pos[2]-size[2]] for z in row])
         solid.sides[0].power = power
-        solid.sides[0].displacement = offsets
+        solid.sides[0].displacement[:,:,2] = numpy.asarray(heightMap, float) - pos[2] - size[2]
         solid.sides[0]._startPosition = [pos[0], pos[1], pos[2]]
         return solid
+
+    ## Create a grid of rectangular displacements from one heightfield
+    #
+    #  The heightfield is sliced into one block of vertices per displacement.
+    #  Neighboring displacements share the vertices on their common edge.
+    #
+    #  @param parent VMF containing the displacements
+    #  @param origin lower left corner of the terrain (x,y,z). Heights are
+    #  relative to z, which is also the top of the displacement brushes.
+    #  @param size size of each displacement on the x and y axes. May be a
+    #  single number for square displacements.
+    #  @param heights 2D array of height values addressed like heights[x][y].
+    #  Each dimension must be a multiple of 2**power, plus 1.
+    #  @param alpha optional alpha values. May be a single value or a 2D array
+    #  the same shape as heights.
+    #  @param power power of every displacement, 2-4 inclusive. If
+    #  vertexBudget is used, this is the highest power a displacement may have.
+    #  @param material texture of displacements
+    #  @param depth depth of the displacement brushes below origin
+    #  @param vertexBudget optional total number of displacement vertices. If
+    #  given, the power of each displacement is chosen by terrainPowers().
+    #
+    #  @return list of VMF solid objects, ordered by y and then x
+    @staticmethod
+    def terrainFromArray(parent, origin, size, heights, alpha=None, power=2, material="", depth=128, vertexBudget=None):
+        if not power in Side.POWERS:
+            raise ValueError('invalid power: ' + str(power))
+        if numpy.isscalar(size):
+            size = (size, size)
+        heights = numpy.asarray(heights)
+        edgeNum = 2**power
+        if heights.ndim != 2 or \
+           (heights.shape[0] - 1)%edgeNum != 0 or \
+           (heights.shape[1] - 1)%edgeNum != 0:
+            raise ValueError('invalid heights dimension: ' + str(heights.shape))
+        if alpha is None:
+            alpha = 0
+        alpha = numpy.broadcast_to(numpy.asarray(alpha), heights.shape)
+
+        tileNum = (int((heights.shape[0] - 1)/edgeNum), int((heights.shape[1] - 1)/edgeNum))
+        if vertexBudget == None:
+            powers = numpy.full(tileNum, power)
+        else:
+            powers = Solid.terrainPowers(heights, power, vertexBudget)
+
+        solids = []
+        for y in range(0, tileNum[1]):
+            for x in range(0, tileNum[0]):
+                corner = [origin[0] + x*size[0], origin[1] + y*size[1], origin[2]]
+                solid = Solid.fromMinMax(
+                    parent,
+                    [corner[0], corner[1], origin[2] - depth],
+                    [corner[0] + size[0], corner[1] + size[1], origin[2]],
+                    material
+                    )
+                side = solid.sides[0]
+                side.power = int(powers[x,y])
+                side._startPosition = corner
+                step = 2**(power - int(powers[x,y]))
+                block = (
+                    slice(x*edgeNum, (x+1)*edgeNum + 1, step),
+                    slice(y*edgeNum, (y+1)*edgeNum + 1, step)
+                    )
+                side._displacement[:,:,2] = heights[block]
+                side._alpha[:,:] = alpha[block]
+                Solid._stitchTerrainEdges(side._displacement[:,:,2], powers, x, y)
+                solids.append(solid)
+        return solids
+
+    ## Choose the power of each displacement in a heightfield
+    #
+    #  Every displacement starts at the lowest power. Displacements are then
+    #  raised one power at a time, in order of the variance of their heights,
+    #  until the vertex budget runs out. Flat displacements are never raised.
+    #
+    #  @param heights 2D array of height values addressed like heights[x][y].
+    #  Each dimension must be a multiple of 2**power, plus 1.
+    #  @param power highest power a displacement may have
+    #  @param vertexBudget total number of displacement vertices. The budget
+    #  is exceeded only if every displacement is already at the lowest power.
+    #
+    #  @return 2D array of powers addressed like powers[x][y]
+    @staticmethod
+    def terrainPowers(heights, power, vertexBudget):
+        heights = numpy.asarray(heights, float)
+        edgeNum = 2**power
+        tiles = numpy.lib.stride_tricks.sliding_window_view(
+            heights, (edgeNum + 1, edgeNum + 1)
+            )[::edgeNum, ::edgeNum]
+        variance = tiles.var(axis=(2,3))
+
+        powers = [x for x in Side.POWERS if x <= power]
+        result = numpy.full(variance.shape, powers[0])
+        remaining = vertexBudget - result.size*(2**powers[0] + 1)**2
+        order = numpy.argsort(-variance, axis=None, kind='stable')
+        order = order[variance.ravel()[order] > 0]
+        for previous, current in zip(powers[:-1], powers[1:]):
+            cost = (2**current + 1)**2 - (2**previous + 1)**2
+            upgrades = order[:max(0, min(len(order), remaining//cost))]
+            result.ravel()[upgrades] = current
+            remaining -= len(upgrades)*cost
+            order = upgrades
+        return result
+
+    ## Move the edge vertices of a displacement onto the edges of neighbors
+    #  with a lower power, so no gaps open between them.
+    @staticmethod
+    def _stitchTerrainEdges(heights, powers, x, y):
+        power = powers[x,y]
+        neighbors = (
+            (x - 1, y, (0, slice(None))),
+            (x + 1, y, (-1, slice(None))),
+            (x, y - 1, (slice(None), 0)),
+            (x, y + 1, (slice(None), -1))
+            )
+        for nx, ny, edge in neighbors:
+            if nx < 0 or ny < 0 or nx >= powers.shape[0] or ny >= powers.shape[1]:
+                continue
+            if powers[nx,ny] < power:
+                step = 2**(power - powers[nx,ny])
+                index = numpy.arange(len(heights[edge]))
+                heights[edge] = numpy.interp(index, index[::step], heights[edge][::step])
     
     ## Create a displacement of any (4-sided, convex) shape
     #
@@ -605,60 +771,86 @@ class Solid:
     #  @param corners corners of displacement in clockwise order.
     #  @param function A function accepting absolute x/y coordinates and outputing the absolute z height
     #  @param material texture of displacement
+    #  @param vectorized if True, function is called once with arrays of x and
+    #  y coordinates and must return an array of heights of the same shape.
     #
     #  @return VMF solid object
     @staticmethod
-    def fromHeightFunction(parent, power, corners, function, material=""):
-        assert len(corners) == 4 #must have 4 corners
-        assert all([len(x)==2 for x in corners]) #must be 2D coordinates
+    def fromHeightFunction(parent, power, corners, function, material="", vectorized=False):
+        return Solid.fromHeightFunctionMany(
+            parent, power, [corners], function, material, vectorized
+            )[0]
+
+    ## Create many displacements of any (4-sided, convex) shape from one
+    #  height function
+    #
+    #  The coordinates of every quad are generated together, so a vectorized
+    #  function is evaluated only once for all of them.
+    #
+    #  @param parent VMF containing the displacements
+    #  @param power power/detail level of displacements, 2-4 inclusive.
+    #  @param quads list of displacement corners. Each entry is 4 corners in
+    #  clockwise order, like the corners argument of fromHeightFunction().
+    #  @param function A function accepting absolute x/y coordinates and outputing the absolute z height
+    #  @param material texture of displacements
+    #  @param vectorized if True, function is called once with arrays of x and
+    #  y coordinates and must return an array of heights of the same shape.
+    #
+    #  @return list of VMF solid objects, in the same order as quads
+    @staticmethod
+    def fromHeightFunctionMany(parent, power, quads, function, material="", vectorized=False):
+        quads = numpy.asarray(quads, float)
+        assert quads.ndim == 3 and quads.shape[1] == 4 #must have 4 corners
+        assert quads.shape[2] == 2 #must be 2D coordinates
         
-        #generate heightmap
-        #determine base elevation
-        minimum = 1024*16 #some high number
+        #generate coordinates, heightMap[quad][i][j] runs from corner 0 to corners 3 and 1
         dimension = 2**power
-        heightMap = []
-        for i in range(dimension, -1, -1):
-            frac1 = float(i)/dimension
-            frac2 = 1 - frac1
-            startColumn = [corners[0][0]*frac1 + corners[3][0]*frac2,
-                           corners[0][1]*frac1 + corners[3][1]*frac2]
-            endColumn = [corners[1][0]*frac1 + corners[2][0]*frac2,
-                           corners[1][1]*frac1 + corners[2][1]*frac2]
-            column = []
-            for j in range(dimension, -1, -1):
-                frac3 = float(j)/dimension
-                frac4 = 1 - frac3
-                #use height function to get height at specified coordinates
-                height = function(
-                    startColumn[0]*frac3 + endColumn[0]*frac4,
-                    startColumn[1]*frac3 + endColumn[1]*frac4
-                    )
-                if height < minimum:
-                    minimum = height
-                column.append(height)
-            heightMap.append(column)
+        frac1 = (dimension - numpy.arange(dimension + 1))/dimension
+        frac1 = frac1[None,:,None]
+        startColumn = quads[:,None,0]*frac1 + quads[:,None,3]*(1 - frac1)
+        endColumn = quads[:,None,1]*frac1 + quads[:,None,2]*(1 - frac1)
+        frac3 = frac1[:,None,:,:]
+        points = startColumn[:,:,None]*frac3 + endColumn[:,:,None]*(1 - frac3)
         
-        #generate solid
-        corners = [x+[minimum] for x in corners]
-        sides = []
-        sides.append(corners[:3]) #top
-        bottom = [x[:2]+[minimum-16] for x in corners[:3]]
-        bottom.reverse()
-        sides.append(bottom) #bottom
-        for i in range(4): #sides
-            p1 = corners[i]
-            p2 = corners[(i+1)%4]
-            p3 = copy.copy(p2)
-            p3[2] = p3[2] + 1
-            sides.append([p1, p2, p3])
-        solid = Solid.fromPlanes(parent, sides, material)
+        #use height function to get height at specified coordinates
+        if vectorized:
+            heightMap = numpy.broadcast_to(
+                numpy.asarray(function(points[...,0], points[...,1]), float),
+                points.shape[:3]
+                )
+        else:
+            heightMap = numpy.array(
+                [function(x, y) for x, y in points.reshape(-1, 2).tolist()],
+                float
+                ).reshape(points.shape[:3])
         
-        #create displacement
-        solid.sides[0].power = power
-        solid.sides[0].displacement = [[[0,0,x - minimum] for x in y] for y in heightMap]
-        solid.sides[0]._startPosition = corners[0]
+        #determine base elevation
+        minimums = numpy.minimum(heightMap.min(axis=(1,2)), 1024*16) #some high number
         
-        return solid
+        solids = []
+        for quad, heights, minimum in zip(quads.tolist(), heightMap, minimums.tolist()):
+            #generate solid
+            corners = [x+[minimum] for x in quad]
+            sides = []
+            sides.append(corners[:3]) #top
+            bottom = [x[:2]+[minimum-16] for x in corners[:3]]
+            bottom.reverse()
+            sides.append(bottom) #bottom
+            for i in range(4): #sides
+                p1 = corners[i]
+                p2 = corners[(i+1)%4]
+                p3 = copy.copy(p2)
+                p3[2] = p3[2] + 1
+                sides.append([p1, p2, p3])
+            solid = Solid.fromPlanes(parent, sides, material)
+            
+            #create displacement
+            solid.sides[0].power = power
+            solid.sides[0]._displacement[:,:,2] = heights - minimum
+            solid.sides[0]._startPosition = corners[0]
+            solids.append(solid)
+        
+        return solids
 
     ## Create cylindrical solid
     #
@@ -865,11 +1057,13 @@ class Solid:
         return Solid.fromRevolution(parent, pos, profile, subdivisions, material)
 
     ## INTERNAL!! export to key-value list format. Used in saving VMF files
-    def toKVL(self):
+    #
+    #  @param displacementRows optional preformatted rows from Side.formatDisplacements()
+    def toKVL(self, displacementRows=None):
         solidKVL = KeyValueList()
         solidKVL.add("id", str(self.id))
         for side in self.sides:
-            solidKVL.add("side", side.toKVL())
+            solidKVL.add("side", side.toKVL(displacementRows))
 
         return solidKVL
 
@@ -889,10 +1083,305 @@ class Solid:
     def transform(self, transform, materialLock=False, materialScaleLock=False, origin=None):
         if origin == None:
             origin = self.origin
-        for side in self.sides:
-            side.transform(transform, materialLock, materialScaleLock, origin)
+        if self.parent.deferTransforms:
+            self._pendingTransforms.append(
+                (transform, materialLock, materialScaleLock, list(origin))
+                )
+            self._invalidateGeometry()
+        else:
+            Side.transformMany(self.sides, transform, materialLock, materialScaleLock, origin)
         self.origin = transform.transformVector(origin)
 
+    ## INTERNAL! Apply transformations recorded while VMF.deferTransforms was
+    #  set. Consecutive transformations with the same material locks are
+    #  multiplied into one matrix and applied to the sides in one pass. This
+    #  rounds differently than applying them one at a time. Texture locked
+    #  offsets are wrapped once instead of after every transformation, so
+    #  they may differ by multiples of 1024, or by more if the solid was
+    #  scaled unevenly.
+    def _applyPendingTransforms(self):
+        pending = self._pendingTransforms
+        self._pendingTransforms = []
+        if not self._sides:
+            return
+        for locks, group in itertools.groupby(pending, lambda x: x[1:3]):
+            matrix = numpy.identity(4)
+            for transform, materialLock, materialScaleLock, origin in group:
+                # move to origin, transform, move back
+                step = transform._matrix.copy()
+                step[:3,3] += origin - step[:3,:3] @ origin
+                matrix = step @ matrix
+            Side._transformSides(self._sides, [matrix], locks[0], locks[1])
+
+    ## Get the vertices of the solid
+    #
+    #  Vertices are calculated from the planes of the sides and cached until a
+    #  plane changes.
+    #
+    #  @return numpy array of unique (x,y,z) vertices
+    #  @sa buildGeometry()
+    def vertices(self):
+        if self._vertices is None:
+            Solid.buildGeometry([self])
+        return self._vertices
+
+    ## Get the axis aligned bounding box of the solid
+    #
+    #  @return ([min x, min y, min z], [max x, max y, max z]) or None if the
+    #  planes do not enclose a volume
+    #  @sa buildGeometry()
+    def bounds(self):
+        if self._vertices is None:
+            Solid.buildGeometry([self])
+        return self._bounds
+
+    ## INTERNAL! Discard cached geometry. Called when a plane changes.
+    def _invalidateGeometry(self):
+        self._vertices = None
+        self._bounds = None
+        for side in self._sides:
+            side._winding = None
+            side._area = None
+
+    ## Calculate and cache vertices, bounds, and side windings for many solids
+    #  at once.
+    #
+    #  Solids are grouped by number of sides. For each group every combination
+    #  of three planes is intersected and the intersections that lie inside all
+    #  of a solid's planes are kept as its vertices. The vertices lying on each
+    #  plane are then ordered into that side's winding. All of this is done
+    #  with array operations over the whole group.
+    #
+    #  The number of combinations grows with the cube of the number of sides,
+    #  so solids with more than _GEOMETRY_BATCH_SIDES sides are instead built
+    #  one at a time by _clipGeometry().
+    #
+    #  @param solids list of Solids
+    @staticmethod
+    def buildGeometry(solids):
+        groups = {}
+        for solid in solids:
+            groups.setdefault(len(solid.sides), []).append(solid)
+
+        for sideNum, group in groups.items():
+            if sideNum < 4: #too few planes to enclose a volume
+                for solid in group:
+                    solid._setGeometry(numpy.zeros((0,3)), None, [numpy.zeros((0,3))]*sideNum, [0.0]*sideNum)
+                continue
+            if sideNum > Solid._GEOMETRY_BATCH_SIDES:
+                for solid in group:
+                    Solid._clipGeometry(solid)
+                continue
+            combinations = numpy.array(list(itertools.combinations(range(sideNum), 3)))
+            #limit the size of the intermediate arrays
+            chunk = max(1, Solid._GEOMETRY_CHUNK//(len(combinations)*sideNum))
+            for start in range(0, len(group), chunk):
+                Solid._buildGeometryGroup(group[start:start + chunk], combinations)
+
+    ## distance tolerance used when building geometry
+    _EPSILON = 0.01
+    ## maximum number of vertex/plane pairs evaluated in one batch
+    _GEOMETRY_CHUNK = 2**22
+    ## solids with more sides than this are built one at a time
+    _GEOMETRY_BATCH_SIDES = 24
+    ## half the size of the polygon each side starts from in _clipGeometry()
+    _GEOMETRY_EXTENT = 2.0**17
+
+    ## Get the outward facing unit normals and plane distances of solids
+    #
+    #  @param solids list of Solids with the same number of sides
+    #  @return (normals, distances) arrays indexed by (solid, side)
+    @staticmethod
+    def _planeEquations(solids):
+        planes = numpy.array(
+            [[side.plane for side in solid.sides] for solid in solids],
+            dtype=float
+            ) #(solid, side, point, xyz)
+        normals = numpy.cross(planes[:,:,2] - planes[:,:,0], planes[:,:,1] - planes[:,:,0])
+        lengths = numpy.linalg.norm(normals, axis=2)
+        normals /= numpy.where(lengths > 0, lengths, 1)[:,:,None]
+        distances = numpy.einsum('knj,knj->kn', normals, planes[:,:,0])
+        return normals, distances
+
+    ## Intersect combinations of three planes
+    #
+    #  @return (solvable, points) arrays indexed by (solid, combination)
+    @staticmethod
+    def _intersectPlanes(normals, distances, combinations):
+        a = normals[:,combinations] #(solid, combination, plane, xyz)
+        b = distances[:,combinations]
+        solvable = numpy.abs(numpy.linalg.det(a)) > 1e-6
+        a = numpy.where(solvable[:,:,None,None], a, numpy.eye(3))
+        points = numpy.linalg.solve(a, b[:,:,:,None])[:,:,:,0]
+        points = numpy.round(points, 6) + 0.0 #no negative zeros
+        return solvable, points
+
+    ## Calculate and cache the geometry of one solid by clipping polygons
+    #
+    #  Each side starts as a large square on its plane, which is clipped by
+    #  the solid's other planes until it lies inside all of them. The
+    #  vertices, bounds, and areas are taken from the resulting windings.
+    #
+    #  @param solid Solid
+    @staticmethod
+    def _clipGeometry(solid):
+        epsilon = Solid._EPSILON
+        extent = Solid._GEOMETRY_EXTENT
+        normals, distances = Solid._planeEquations([solid])
+        normals = normals[0]
+        distances = distances[0]
+        windings = []
+        areas = []
+        for n in range(len(normals)):
+            normal = normals[n]
+            if not normal.any():
+                windings.append(numpy.zeros((0,3)))
+                areas.append(0.0)
+                continue
+            helper = [0.0,0.0,1.0] if abs(normal[2]) < 0.9 else [1.0,0.0,0.0]
+            u = numpy.cross(normal, helper)
+            u /= numpy.linalg.norm(u)
+            v = numpy.cross(normal, u)
+            center = normal*distances[n]
+            #clockwise seen from the outside, like the windings of
+            #_buildGeometryGroup()
+            winding = center + extent*numpy.array([u + v, u - v, -u - v, -u + v])
+            others = numpy.delete(numpy.arange(len(normals)), n)
+            while len(winding) > 0:
+                offsets = winding.dot(normals[others].T) - distances[others]
+                worst = offsets.max(axis=0)
+                if worst.max() <= epsilon:
+                    break
+                #clip by the plane the winding reaches furthest past first,
+                #which removes the most of it
+                m = worst.argmax()
+                winding = Solid._clipWinding(winding, offsets[:,m])
+                others = numpy.delete(others, m)
+            if len(winding) > 0:
+                winding = winding[numpy.linalg.norm(winding - numpy.roll(winding, 1, axis=0), axis=1) > epsilon]
+            if len(winding) < 3:
+                windings.append(numpy.zeros((0,3)))
+                areas.append(0.0)
+                continue
+            windings.append(winding)
+            crosses = numpy.cross(winding, numpy.roll(winding, -1, axis=0)).sum(axis=0)
+            areas.append(abs(crosses.dot(normal))/2)
+
+        points = numpy.concatenate(windings)
+        if len(points) == 0 or numpy.abs(points).max() >= extent/2:
+            #the planes do not enclose a volume
+            sideNum = len(solid.sides)
+            solid._setGeometry(numpy.zeros((0,3)), None, [numpy.zeros((0,3))]*sideNum, [0.0]*sideNum)
+            return
+        points = numpy.round(points, 6) + 0.0 #no negative zeros
+        points = points[numpy.lexsort((points[:,2], points[:,1], points[:,0]))]
+        keep = numpy.ones(len(points), bool)
+        keep[1:] = numpy.any(numpy.abs(points[1:] - points[:-1]) > epsilon, axis=1)
+        vertices = points[keep]
+        bounds = (vertices.min(axis=0).tolist(), vertices.max(axis=0).tolist())
+        solid._setGeometry(vertices, bounds, windings, areas)
+
+    ## Clip a polygon by a plane, keeping the part behind it
+    #
+    #  @param winding array of (x,y,z) vertices
+    #  @param offsets distance of each vertex in front of the plane
+    #  @return array of the vertices of the clipped polygon
+    @staticmethod
+    def _clipWinding(winding, offsets):
+        inside = offsets <= Solid._EPSILON
+        result = []
+        for i in range(len(winding)):
+            j = (i + 1)%len(winding)
+            if inside[i]:
+                result.append(winding[i])
+            if inside[i] != inside[j]:
+                t = offsets[i]/(offsets[i] - offsets[j])
+                result.append(winding[i] + t*(winding[j] - winding[i]))
+        return numpy.array(result).reshape(-1, 3)
+
+    @staticmethod
+    def _buildGeometryGroup(solids, combinations):
+        epsilon = Solid._EPSILON
+        normals, distances = Solid._planeEquations(solids)
+
+        #intersect every combination of three planes
+        solvable, points = Solid._intersectPlanes(normals, distances, combinations)
+
+        #keep intersections inside all planes
+        offsets = numpy.einsum('kcj,knj->kcn', points, normals) - distances[:,None,:]
+        valid = solvable & numpy.all(offsets <= epsilon, axis=2)
+        onSide = (valid[:,:,None] & (numpy.abs(offsets) <= epsilon)).transpose(0,2,1) #(solid, side, combination)
+
+        #order the vertices on each side clockwise (seen from the outside) by
+        #angle around the side's center
+        counts = onSide.sum(axis=2)
+        centers = numpy.einsum('knc,kcj->knj', onSide, points)/numpy.maximum(counts, 1)[:,:,None]
+        helper = numpy.where(
+            (numpy.abs(normals[:,:,2]) < 0.9)[:,:,None],
+            numpy.array([0.0,0.0,1.0]),
+            numpy.array([1.0,0.0,0.0])
+            )
+        u = numpy.cross(normals, helper)
+        u /= numpy.maximum(numpy.linalg.norm(u, axis=2), 1e-12)[:,:,None]
+        v = numpy.cross(normals, u)
+        relative = points[:,None,:,:] - centers[:,:,None,:] #(solid, side, combination, xyz)
+        angles = numpy.arctan2(
+            numpy.einsum('kncj,knj->knc', relative, v),
+            numpy.einsum('kncj,knj->knc', relative, u)
+            )
+        order = numpy.argsort(numpy.where(onSide, -angles, numpy.inf), axis=2)
+        relative = numpy.take_along_axis(relative, order[:,:,:,None], axis=2)
+
+        #area of each winding
+        index = numpy.arange(len(combinations))
+        inWinding = index < counts[:,:,None]
+        following = numpy.where(index + 1 < counts[:,:,None], index + 1, 0)
+        following = numpy.take_along_axis(relative, following[:,:,:,None], axis=2)
+        crosses = numpy.cross(relative, following)*inWinding[:,:,:,None]
+        areas = numpy.abs(numpy.einsum('knj,knj->kn', crosses.sum(axis=2), normals))/2
+
+        #drop repeated vertices where more than three planes meet
+        preceding = numpy.where(index > 0, index - 1, numpy.maximum(counts[:,:,None] - 1, 0))
+        preceding = numpy.take_along_axis(relative, preceding[:,:,:,None], axis=2)
+        keep = inWinding & (numpy.linalg.norm(relative - preceding, axis=3) > epsilon)
+        keep[:,:,0] |= (counts > 0) & ~keep.any(axis=2)
+        order = numpy.argsort(~keep, axis=2, kind='stable')
+        windings = numpy.take_along_axis(relative, order[:,:,:,None], axis=2) + centers[:,:,None,:]
+        windingCounts = keep.sum(axis=2).tolist()
+
+        #unique vertices and bounds of each solid
+        order = numpy.lexsort((points[:,:,2], points[:,:,1], points[:,:,0], ~valid), axis=1)
+        vertices = numpy.take_along_axis(points, order[:,:,None], axis=1)
+        valid = numpy.take_along_axis(valid, order, axis=1)
+        keep = valid.copy()
+        keep[:,1:] &= numpy.any(numpy.abs(vertices[:,1:] - vertices[:,:-1]) > epsilon, axis=2)
+        order = numpy.argsort(~keep, axis=1, kind='stable')
+        vertices = numpy.take_along_axis(vertices, order[:,:,None], axis=1)
+        vertexCounts = keep.sum(axis=1).tolist()
+        hidden = ~valid[:,:,None]
+        mins = numpy.where(hidden, numpy.inf, vertices).min(axis=1).tolist()
+        maxs = numpy.where(hidden, -numpy.inf, vertices).max(axis=1).tolist()
+        areas = areas.tolist()
+
+        for k in range(len(solids)):
+            if vertexCounts[k] == 0:
+                bounds = None
+            else:
+                bounds = (mins[k], maxs[k])
+            solids[k]._setGeometry(
+                vertices[k,:vertexCounts[k]],
+                bounds,
+                [windings[k,n,:windingCounts[k][n]] for n in range(len(windingCounts[k]))],
+                areas[k]
+                )
+
+    def _setGeometry(self, vertices, bounds, windings, areas):
+        self._vertices = vertices
+        self._bounds = bounds
+        for side, winding, area in zip(self.sides, windings, areas):
+            side._winding = winding
+            side._area = area
+
 
 ## side/face of a vmf solid. Contains displacement information if this side is a
 #  displacement.
@@ -900,6 +1389,8 @@ class Side:
 
     ## list of valid displacement powers
     POWERS = (2,3,4)
+    ## numpy data type used to store displacement offsets and alphas
+    DISPLACEMENT_TYPE = numpy.float32
 
     ## Constructor. Create a side using 3 points on the plane
     #
@@ -916,6 +1407,9 @@ class Side:
 
         ## unique ID
         self.id = parent.generateId()
+        #  cached geometry, see Solid.buildGeometry()
+        self._winding = None
+        self._area = None
         ## plane defined by 3 points
         self.plane = plane
         ## material displayed on this side
@@ -948,9 +1442,14 @@ class Side:
         if parent != None:
             new.parent = parent
         new.id = new.parent.generateId()
+        new._winding = None
+        new._area = None
         new.textureAxes = copy.copy(self.textureAxes)
         new.offset = copy.copy(self.offset)
         new.scale = copy.copy(self.scale)
+        if self._vertexNum != 0:
+            new._displacement = self._displacement.copy()
+            new._alpha = self._alpha.copy()
         return new
 
     ## Create a side using 1 point on the plane and 1 normal vector
@@ -1014,6 +1513,34 @@ class Side:
             ]
         return Side(parent, points, material)
     
+    def _getPlane(self):
+        return self._plane
+
+    def _setPlane(self, plane):
+        self._plane = plane
+        self.parent._invalidateGeometry()
+    ## plane defined by 3 points. Reassign rather than modifying the points in
+    #  place so cached geometry is updated.
+    plane = property(fget=_getPlane, fset=_setPlane)
+
+    ## Get the polygon of this side, as clipped by the other sides of the solid
+    #
+    #  @return numpy array of (x,y,z) vertices in winding order
+    #  @sa Solid.buildGeometry()
+    def winding(self):
+        if self._winding is None:
+            Solid.buildGeometry([self.parent])
+        return self._winding
+
+    ## Get the surface area of this side
+    #
+    #  @return area in square units
+    #  @sa Solid.buildGeometry()
+    def area(self):
+        if self._area is None:
+            Solid.buildGeometry([self.parent])
+        return self._area
+
     def _getPower(self):
         if self._vertexNum == 0:
             return 0
@@ -1031,15 +1558,14 @@ class Side:
                 self._vertexNum = int(2**power + 1)
                 # this doesn't work for all displacements. This is solved by manually setting _startPosition
                 self._startPosition = [-8192, -8192, -8192]
-                self._displacement = []
-                for x in range(0, self._vertexNum):
-                    column = []
-                    for y in range(0, self._vertexNum):
-                        column.append([0,0,0])
-                    self._displacement.append(column)
-                self._alpha = []
-                for x in range(0, self._vertexNum):
-                    self._alpha.append([0]*self._vertexNum)
+                self._displacement = numpy.zeros(
+                    (self._vertexNum, self._vertexNum, 3),
+                    Side.DISPLACEMENT_TYPE
+                    )
+                self._alpha = numpy.zeros(
+                    (self._vertexNum, self._vertexNum),
+                    Side.DISPLACEMENT_TYPE
+                    )
         else:
             raise Exception("Invalid power: " + str(power))
     ## Power of displacement
@@ -1060,15 +1586,12 @@ class Side:
         if self._vertexNum == 0:
             raise Exception("Cannot modify displacement when power is zero.")
 
-        if len(displacement) != self._vertexNum or \
-           len(displacement[0]) != self._vertexNum:
-            raise Exception(
-                "Power/vertex number mismatch. Expected %ix%i vertices, got %ix%i." %
-                (self._vertexNum, self._vertexNum, len(displacement), len(displacement[0]))
-                )
-        self._displacement = displacement
+        self._displacement = Side._displacementArray(
+            displacement, (self._vertexNum, self._vertexNum, 3)
+            )
     ## displacement offset values
-    #  displacement is a 2d array of offsets. It is a column-major array, addressed like disp[x][y]
+    #  displacement is a numpy array of offsets with shape (vertexNum, vertexNum, 3).
+    #  It is column-major, addressed like disp[x][y] or disp[x,y]
     displacement = property(fget=_getDisplacement, fset=_setDisplacement)
 
     def _getAlpha(self):
@@ -1081,17 +1604,34 @@ class Side:
         if self._vertexNum == 0:
             raise Exception("Cannot modify alpha when power is zero.")
 
-        if len(alpha) != self._vertexNum or \
-           len(alpha[0]) != self._vertexNum:
-            raise Exception(
-                "Power/vertex number mismatch. Expected %ix%i vertices, got %ix%i." %
-                (self._vertexNum, self._vertexNum, len(alpha), len(alpha[0]))
-                )
-
-        self._alpha = alpha
+        self._alpha = Side._displacementArray(
+            alpha, (self._vertexNum, self._vertexNum)
+            )
     ## displacement alpha values
+    #  alpha is a numpy array with shape (vertexNum, vertexNum)
     alpha = property(fget=_getAlpha, fset=_setAlpha)
 
+    ## Convert displacement values to an array of the expected shape
+    #
+    #  @param values nested sequences or array
+    #  @param shape expected shape of the array
+    #  @return numpy array of type Side.DISPLACEMENT_TYPE
+    @staticmethod
+    def _displacementArray(values, shape):
+        try:
+            array = numpy.array(values, Side.DISPLACEMENT_TYPE)
+        except ValueError:
+            raise Exception(
+                "Power/vertex number mismatch. Expected shape %s, got an irregular array." %
+                (shape,)
+                )
+        if array.shape != shape:
+            raise Exception(
+                "Power/vertex number mismatch. Expected shape %s, got shape %s." %
+                (shape, array.shape)
+                )
+        return array
+
     ## INTERNAL! Create Side from Key-value dictionary. Used in parsing VMF files.
     #
     # @todo doesn't support offsets
@@ -1175,27 +1715,17 @@ class Side:
                 )
 
         # Generate displacement from normals and distances
-        side._displacement = []
-        for x in range(0, side.vertexNum):
-            column = []
-            for y in range(0, side.vertexNum):
-                column.append(
-                    [distances[y][x] * normals[y][x*3],
-                     distances[y][x] * normals[y][x*3 + 1],
-                     distances[y][x] * normals[y][x*3 + 2]]
-                    )
-            side._displacement.append(column)
+        # Rows are stored by y, so swap to address by [x][y]
+        normals = numpy.array(normals).reshape(side.vertexNum, side.vertexNum, 3)
+        distances = numpy.array(distances)
+        side._displacement = (normals*distances[:,:,None]).transpose(1,0,2).astype(Side.DISPLACEMENT_TYPE)
 
         # Get the alpha
         alphasKVD = dispInfoKVD["alphas"][0]
-        side._alpha = []
-        for x in range(0, side.vertexNum):
-            side._alpha.append(
-                SDKUtil.getNumbers(
-                    alphasKVD["row%i" % x][0],
-                    float
-                    )
-                )
+        side._alpha = numpy.array(
+            [SDKUtil.getNumbers(alphasKVD["row%i" % x][0], float) for x in range(0, side.vertexNum)],
+            Side.DISPLACEMENT_TYPE
+            )
 
     def _findNearestAxes(self):
         a = (
@@ -1231,8 +1761,50 @@ class Side:
                 [0,0,-1]
                 ]
 
+    ## INTERNAL! Format the offset and alpha rows of many displacements at
+    #  once. Used in saving VMF files
+    #
+    #  Sides with the same power are stacked into one array and formatted with
+    #  a single string operation per batch.
+    #
+    #  @param sides list of Sides. Sides without displacements are ignored.
+    #  @return dict mapping each displacement Side to (offset rows, alpha rows)
+    @staticmethod
+    def formatDisplacements(sides):
+        groups = {}
+        for side in sides:
+            if side._vertexNum != 0:
+                groups.setdefault(side._vertexNum, []).append(side)
+
+        rows = {}
+        for vertexNum, group in groups.items():
+            for start in range(0, len(group), Side._FORMAT_BATCH):
+                batch = group[start:start + Side._FORMAT_BATCH]
+                # Rows are written by y, so swap to [side][y][x]
+                offsets = numpy.array([side._displacement for side in batch]).transpose(0,2,1,3)
+                alphas = numpy.array([side._alpha for side in batch]).transpose(0,2,1)
+                offsetRows = Side._formatRows(offsets.reshape(-1, vertexNum*3))
+                alphaRows = Side._formatRows(alphas.reshape(-1, vertexNum))
+                for i in range(len(batch)):
+                    rows[batch[i]] = (
+                        offsetRows[i*vertexNum:(i+1)*vertexNum],
+                        alphaRows[i*vertexNum:(i+1)*vertexNum]
+                        )
+        return rows
+
+    ## number of displacements formatted in one batch
+    _FORMAT_BATCH = 256
+
+    @staticmethod
+    def _formatRows(array):
+        rowFormat = "%g " * array.shape[1] + "\n"
+        text = (rowFormat * array.shape[0]) % tuple(array.ravel().tolist())
+        return text.split("\n")[:-1]
+
     ## INTERNAL! export to key-value list format. Used in saving VMF files
-    def toKVL(self):
+    #
+    #  @param displacementRows optional preformatted rows from formatDisplacements()
+    def toKVL(self, displacementRows=None):
         sideKVL = KeyValueList()
         sideKVL.add("id", str(self.id))
         sideKVL.add(
@@ -1271,24 +1843,22 @@ class Side:
                 "[%g %g %g]" % tuple(self._startPosition)
             )
 
+            if displacementRows != None and self in displacementRows:
+                offsetRows, alphaRows = displacementRows[self]
+            else:
+                offsetRows, alphaRows = Side.formatDisplacements([self])[self]
+
             offsetsKVL = KeyValueList()
             offsetNormalsKVL = KeyValueList()
-            for y in range(0, len(self.displacement[0])):
-                offsetsRow = ""
-                for x in range(0, len(self.displacement)):
-                    offsetsRow += "%g %g %g " % tuple(self.displacement[x][y])
-                    
-                offsetsKVL.add("row%i" % y, offsetsRow)
+            for y in range(0, self._vertexNum):
+                offsetsKVL.add("row%i" % y, offsetRows[y])
 
             dispInfoKVL.add("offsets", offsetsKVL)
             #dispInfoKVL.add("offset_normals", offsetNormalsKVL)
 
             alphasKVL = KeyValueList()
-            for y in range(0, len(self.alpha)):
-                alphaRow = ""
-                for x in range(0, len(self.alpha[y])):
-                    alphaRow += "%g " % self.alpha[x][y]
-                alphasKVL.add("row%i" % y, alphaRow)
+            for y in range(0, self._vertexNum):
+                alphasKVL.add("row%i" % y, alphaRows[y])
             dispInfoKVL.add("alphas", alphasKVL)
 
             sideKVL.add("dispinfo", dispInfoKVL)
@@ -1304,83 +1874,129 @@ class Side:
     #  @param origin optional transformation origin to override brush origin
     #  @sa Matrix
     def transform(self, matrix, materialLock=False, materialScaleLock=False, origin=None):
-        if origin != None:
-            self.transform(
-                Matrix.fromTranslate(-origin[0], -origin[1], -origin[2]),
-                materialLock,
-                materialScaleLock
-                )
-        
-        self.plane = [matrix.transformVector(p) for p in self.plane]
+        Side.transformMany([self], matrix, materialLock, materialScaleLock, origin)
+
+    ## transform many sides using one or more transformation matrices
+    #
+    #  The planes, texture axes and texture offsets of all the sides are
+    #  gathered into arrays once, run through every matrix, and written back
+    #  once. The result is the same as calling transform() on each side with
+    #  each matrix in turn.
+    #
+    #  @param sides list of Sides
+    #  @param matrix a 4x4 transformation matrix, or a list of them to apply
+    #  in order
+    #  @param materialLock If true, textures are "locked" to the sides and are
+    #  transformed with them. Hammer calls it texture lock.
+    #  @param materialScaleLock If true, textures scale with the sides.
+    #  @param origin optional transformation origin. Either one (x,y,z) point
+    #  for all sides or one point per side.
+    #  @sa Matrix
+    @staticmethod
+    def transformMany(sides, matrix, materialLock=False, materialScaleLock=False, origin=None):
+        if len(sides) == 0:
+            return
+        if isinstance(matrix, Matrix):
+            matrix = [matrix]
+        steps = []
+        for m in matrix:
+            steps += Side._originSteps(m, origin)
+        Side._transformSides(sides, steps, materialLock, materialScaleLock)
+
+    ## INTERNAL! Expand a matrix applied around an origin into the 4x4 steps
+    #  used by _transformSides(): move to the origin, transform, move back.
+    @staticmethod
+    def _originSteps(matrix, origin):
+        if origin is None:
+            return [matrix._matrix]
+        origin = numpy.asarray(origin, float)
+        shift = numpy.broadcast_to(numpy.identity(4), origin.shape[:-1] + (4, 4)).copy()
+        unshift = shift.copy()
+        shift[...,:3,3] = -origin
+        unshift[...,:3,3] = origin
+        return [shift, matrix._matrix, unshift]
+
+    ## INTERNAL! Apply a sequence of 4x4 matrices to sides. Each step is either
+    #  one matrix for all sides or an array with one matrix per side.
+    #  Arithmetic is done in the same order as transforming by each step in
+    #  turn, so results do not depend on batching.
+    @staticmethod
+    def _transformSides(sides, steps, materialLock, materialScaleLock):
+        steps = [numpy.broadcast_to(step, (len(sides), 4, 4)) for step in steps]
+        planes = numpy.array([side.plane for side in sides], float)
+        for step in steps:
+            planes = Matrix._applyMany(step[:,None], planes, True)
+        for side, plane in zip(sides, planes.tolist()):
+            side._plane = plane
+        for solid in {id(side.parent): side.parent for side in sides}.values():
+            solid._invalidateGeometry()
         
         #if it is a displacement, transform startPosition and offset data
-        if self._vertexNum != 0:
-            self._startPosition = matrix.transformVector(self._startPosition)
-            offsets = []
-            for x in range(len(self._displacement)):
-                column = []
-                for y in range(len(self._displacement)):
-                    column.append(matrix.rotateVector(self._displacement[x][y]))
-                offsets.append(column)
-            self._displacement = offsets
+        for index, side in enumerate(sides):
+            if side._vertexNum != 0:
+                startPosition = numpy.array(side._startPosition, float)
+                rotation = numpy.identity(3)
+                for step in steps:
+                    startPosition = Matrix._applyMany(step[index], startPosition, True)
+                    rotation = step[index,:3,:3] @ rotation
+                side._startPosition = startPosition.tolist()
+                # pure translations (such as origin shifts) leave offsets alone
+                if not numpy.array_equal(rotation, numpy.identity(3)):
+                    offsets = side._displacement.reshape(-1, 3) @ rotation.T
+                    side._displacement = offsets.reshape(side._displacement.shape).astype(
+                        Side.DISPLACEMENT_TYPE
+                        )
 
         if materialLock:
-            uAxis = matrix.rotateVector(self.textureAxes[0])
-            vAxis = matrix.rotateVector(self.textureAxes[1])
-
-            uMagnitude = math.sqrt(
-                uAxis[0]*uAxis[0] +
-                uAxis[1]*uAxis[1] +
-                uAxis[2]*uAxis[2]
-                )
-            vMagnitude = math.sqrt(
-                vAxis[0]*vAxis[0] +
-                vAxis[1]*vAxis[1] +
-                vAxis[2]*vAxis[2]
-                )
-
-            if materialScaleLock:
-                self.scale[0] *= uMagnitude
-                self.scale[1] *= vMagnitude
-
-            #normalize
-            uAxis = [
-                uAxis[0]/uMagnitude,
-                uAxis[1]/uMagnitude,
-                uAxis[2]/uMagnitude
-                ]
-            vAxis = [
-                vAxis[0]/vMagnitude,
-                vAxis[1]/vMagnitude,
-                vAxis[2]/vMagnitude
-                ]
+            axes = numpy.array([side.textureAxes for side in sides], float)
+            scales = numpy.array([side.scale[:2] for side in sides], float)
+            offsets = numpy.array([side.offset[:2] for side in sides], float)
+            for step in steps:
+                axes = Matrix._applyMany(step[:,None], axes, False)
+                magnitudes = numpy.sqrt(
+                    axes[:,:,0]*axes[:,:,0] +
+                    axes[:,:,1]*axes[:,:,1] +
+                    axes[:,:,2]*axes[:,:,2]
+                    )
+                
+                if materialScaleLock:
+                    scales = scales*magnitudes
+                
+                #normalize
+                axes = axes/magnitudes[:,:,None]
+                
+                x = step[:,None,0,3]
+                y = step[:,None,1,3]
+                z = step[:,None,2,3]
+                offsets = offsets - ((axes[:,:,0]*x + axes[:,:,1]*y + axes[:,:,2]*z)/scales)%1024
             
-            self.textureAxes = [
-                uAxis,
-                vAxis
-                ]
+            for side, sideAxes, scale, offset in zip(sides, axes.tolist(), scales.tolist(), offsets.tolist()):
+                side.textureAxes = sideAxes
+                if materialScaleLock:
+                    side.scale[0:2] = scale
+                side.offset[0:2] = offset
+        else:
+            for side, axes in zip(sides, Side._findNearestAxesMany(planes)):
+                side.textureAxes = axes
 
+    ## INTERNAL! Vectorized _findNearestAxes() for an array of planes
+    @staticmethod
+    def _findNearestAxesMany(planes):
+        a = planes[:,1] - planes[:,0]
+        b = planes[:,2] - planes[:,0]
 
-            #print("Texture axes:", self.textureAxes) ## @fixme was someone in the middle of debugging something?
-            x = matrix._matrix[0][3]
-            y = matrix._matrix[1][3]
-            z = matrix._matrix[2][3]
+        #cross product results in (non-unit) normal vector
+        i = numpy.abs(a[:,1]*b[:,2] - a[:,2]*b[:,1])
+        j = numpy.abs(a[:,2]*b[:,0] - a[:,0]*b[:,2])
+        k = numpy.abs(a[:,0]*b[:,1] - a[:,1]*b[:,0])
 
-            self.offset[0] -= ((self.textureAxes[0][0]*x + 
-                                self.textureAxes[0][1]*y + 
-                                self.textureAxes[0][2]*z)/self.scale[0])%1024
-            self.offset[1] -= ((self.textureAxes[1][0]*x + 
-                                self.textureAxes[1][1]*y + 
-                                self.textureAxes[1][2]*z)/self.scale[1])%1024
-        else:
-            self.textureAxes = self._findNearestAxes()
-        
-        if origin != None:
-            self.transform(
-                Matrix.fromTranslate(origin[0], origin[1], origin[2]),
-                materialLock,
-                materialScaleLock
-                )
+        #Up/down, East/west, North/south
+        choice = numpy.where((k >= j) & (k >= i), 0, numpy.where(i > j, 1, 2))
+        return numpy.array([
+            [[1,0,0],[0,-1,0]],
+            [[0,1,0],[0,0,-1]],
+            [[1,0,0],[0,0,-1]]
+            ])[choice].tolist()
 
 
 ## VMF entity output
@@ -1412,6 +2028,206 @@ class Entity(object):
     ## @todo tidy up
     ## @todo add output/connection interface
 
+    ## INTERNAL! Information shared by every entity of one class in one game.
+    #  Built once from the FGD.
+    class _Template:
+
+        ## constructor
+        #
+        #  @param definition FGD.Entity of the class
+        def __init__(self, definition):
+            ## FGD parameters in file order
+            self.parameters = list(definition.parameters)
+            ## default value of every property
+            self.defaults = {}
+            for parameter in self.parameters:
+                self.defaults[parameter.name] = parameter.default
+            if not "origin" in self.defaults:
+                self.defaults["origin"] = [0.0, 0.0, 0.0]
+            ## empty connection list of every output, in file order
+            self.outputs = {}
+            for output in definition.outputs:
+                self.outputs[output.name] = []
+            ## position of every output in file order
+            self.outputOrder = {name: i for i, name in enumerate(self.outputs)}
+            ## names of vector properties other than origin, transformed as
+            #  points
+            self.vectors = []
+            ## names of axis properties, transformed point by point
+            self.axes = []
+            ## names of angle properties
+            self.angles = []
+            for parameter in self.parameters:
+                if parameter.name == "origin":
+                    pass
+                elif parameter.type is FGD.VECTOR:
+                    self.vectors.append(parameter.name)
+                elif parameter.type is FGD.AXIS:
+                    self.axes.append(parameter.name)
+                elif parameter.type is FGD.ANGLE:
+                    self.angles.append(parameter.name)
+            #  see getSerializer()
+            self._serializer = None
+
+        ## Get the list of (name, format function, formatted default) used to
+        #  save every property other than origin. Built on first use.
+        #
+        #  Format functions return the saved string, or None if the property
+        #  is left out. The formatted default is UNFORMATTED if formatting the
+        #  default failed; it is then formatted, and fails, when it is saved.
+        def getSerializer(self):
+            if self._serializer == None:
+                self._serializer = []
+                for parameter in self.parameters:
+                    if parameter.name == "origin":
+                        continue
+                    format = Entity._Template._FORMATS.get(
+                        parameter.type, Entity._Template._formatOther
+                        )
+                    try:
+                        default = format(self.defaults[parameter.name])
+                    except Exception:
+                        default = Entity._Template.UNFORMATTED
+                    self._serializer.append((parameter.name, format, default))
+            return self._serializer
+
+        ## marks a default that could not be formatted ahead of time
+        UNFORMATTED = object()
+
+        @staticmethod
+        def _formatNumber(value):
+            return "%g " % value
+
+        @staticmethod
+        def _formatList(value):
+            return ("%g " * len(value)) % tuple(value)
+
+        @staticmethod
+        def _formatAngle(value):
+            # Change angle order from XYZ to YZX. (The VMF rotation order is actually XYZ, but is stored in YZX order.)
+            # The y axis is also reversed
+            return "%g %g %g" % (-value[1], value[2], value[0])
+
+        @staticmethod
+        def _formatAxis(value):
+            valueStr = ""
+            if isinstance(value[0], list):
+                for valueList in value[:-1]:
+                    for number in valueList[:-1]:
+                        valueStr += "%g " % number
+                    valueStr += str(valueList[-1])
+                    valueStr += ", "
+                    
+                for number in value[-1][:-1]:
+                    valueStr += "%g " % number
+                valueStr += str(value[-1][-1])
+            else:
+                for number in value:
+                    valueStr += "%g " % number
+            return valueStr
+
+        @staticmethod
+        def _formatOther(value):
+            if value != None and len(str(value)) > 0:
+                return str(value)
+            return None
+
+        _FORMATS = {
+            FGD.INTEGER: _formatNumber.__func__,
+            FGD.FLOAT: _formatNumber.__func__,
+            FGD.INTEGER_LIST: _formatList.__func__,
+            FGD.VECTOR: _formatList.__func__,
+            FGD.FLOAT_LIST: _formatList.__func__,
+            FGD.ANGLE: _formatAngle.__func__,
+            FGD.AXIS: _formatAxis.__func__
+            }
+
+    ## INTERNAL! Copy of a list default, returned when the default is read.
+    #  The copy is stored on the entity the first time it is modified, so
+    #  only reading a default leaves the entity unchanged. Lists nested in
+    #  the default are copied the same way.
+    class _ListOnWrite(list):
+
+        ## Constructor
+        #
+        #  @param items default list to copy
+        #  @param store function called before the first modification
+        def __init__(self, items, store):
+            list.__init__(self, [
+                Entity._ListOnWrite(x, store) if isinstance(x, list) else copy.deepcopy(x)
+                for x in items
+                ])
+            self._store = store
+
+        def _storing(method):
+            def storing(self, *args):
+                self._store()
+                return method(self, *args)
+            return storing
+
+        append = _storing(list.append)
+        extend = _storing(list.extend)
+        insert = _storing(list.insert)
+        remove = _storing(list.remove)
+        pop = _storing(list.pop)
+        clear = _storing(list.clear)
+        sort = _storing(list.sort)
+        reverse = _storing(list.reverse)
+        __setitem__ = _storing(list.__setitem__)
+        __delitem__ = _storing(list.__delitem__)
+        __iadd__ = _storing(list.__iadd__)
+        __imul__ = _storing(list.__imul__)
+        del _storing
+
+        ## copies and pickles are plain lists
+        def __reduce_ex__(self, protocol):
+            return (list, (list(self),))
+
+    ## INTERNAL! Dict of values stored on an entity, backed by class
+    #  defaults. Reading a list default returns an Entity._ListOnWrite copy,
+    #  so it can be modified in place without changing the default, and is
+    #  only stored on the entity once it is modified.
+    class _SparseDict(collections.abc.MutableMapping):
+
+        def __init__(self, overrides, defaults):
+            self._overrides = overrides
+            self._defaults = defaults
+
+        def __getitem__(self, key):
+            if key in self._overrides:
+                return self._overrides[key]
+            value = self._defaults[key]
+            if isinstance(value, list):
+                overrides = self._overrides
+                def store():
+                    if key not in overrides:
+                        overrides[key] = result
+                result = Entity._ListOnWrite(value, store)
+                return result
+            return value
+
+        def __setitem__(self, key, value):
+            self._overrides[key] = value
+
+        def __delitem__(self, key):
+            del self._overrides[key]
+
+        def __contains__(self, key):
+            return key in self._defaults or key in self._overrides
+
+        def __iter__(self):
+            for key in self._defaults:
+                yield key
+            for key in self._overrides:
+                if key not in self._defaults:
+                    yield key
+
+        def __len__(self):
+            return len(self._defaults) + len([x for x in self._overrides if x not in self._defaults])
+
+    #  templates by (game ID, class name)
+    _templates = {}
+
     ## constructor
     #
     #  @param parent VMF containing this entity
@@ -1420,55 +2236,163 @@ class Entity(object):
     #  arguments like origin=[x,y,z], model='props/someModel'
     #
     def __init__(self, parent, classname, **kwargs):
+        self._initialize(parent, classname, Entity._getTemplate(parent.gameId, classname), {})
+        self.parent.entities.append(self)
+
+        for key in kwargs:
+            self[key] = kwargs[key]
+
+    ## INTERNAL! Set up a new entity. Shared by the constructor and
+    #  createMany(). Does not add the entity to the VMF.
+    #
+    #  @param parent VMF containing this entity
+    #  @param classname name of entity
+    #  @param template Entity._Template of the class
+    #  @param properties dict of properties that differ from the defaults
+    def _initialize(self, parent, classname, template, properties):
         ## VMF containing this entity
         self.parent = parent
         ## class name or type of this entity
         self.classname = classname
-        self.parent.entities.append(self)
         
         ## unique node ID
         self.id = parent.generateId()
         
-        definition = FGD.getGameFGD(self.parent.gameId)[self.classname]
+        #  defaults shared by all entities of this class
+        self._template = template
 
-        ## entity properties
-        self.properties = {}
-        for parameter in definition.parameters:
-            self.properties[parameter.name] = copy.copy(parameter.default)
-        
-        if not "origin" in self.properties:
-            self.properties["origin"] = [0.0, 0.0, 0.0]
-
-        ## outputs to other entities. Used to trigger things, etc.
-        self.outputs = {}
-        for output in definition.outputs:
-            self.outputs[output.name] = []
+        #  transformations of spatial properties, other than origin, recorded
+        #  while VMF.deferTransforms is set
+        self._pendingTransforms = []
+        #  properties that differ from the defaults, see properties
+        self._properties = properties
+        #  outputs that have connections, see outputs
+        self._outputs = {}
 
         ## list of solids associated with this entity. Used if this is a brush
         #  entity.
         self.solids = []
 
-        for key in kwargs:
-            self[key] = kwargs[key]
-
     ## Create a copy
     #
     #  @param parent parent of the copy
     #  @return Entity
     def copy(self, parent):
         new = Entity(parent, self.classname)
-        new.properties = dict(self.properties)
-        new.outputs = dict(self.outputs)
+        self._applyPendingTransforms()
+        new._properties = dict(self._properties)
+        new._outputs = dict(self._outputs)
         for solid in self.solids:
             solid.copy(new)
         return new
 
+    ## Create many entities of one class at once
+    #
+    #  Property names are checked once for the whole batch, and each entity
+    #  stores its values without being validated key by key. The entities are
+    #  the same as ones made with the constructor, in the same order.
+    #
+    #  @param parent VMF containing the entities
+    #  @param classname name of entity
+    #  @param origins list or array of [x,y,z] origins, one per entity
+    #  @param angles optional list or array of [x,y,z] angles, one per entity
+    #  @param columns other entity properties, such as
+    #  model=['props/someModel']*len(origins). Each is a list or array with one
+    #  value per entity.
+    #  @return list of Entities
+    @staticmethod
+    def createMany(parent, classname, origins, angles=None, **columns):
+        template = Entity._getTemplate(parent.gameId, classname)
+        columns["origin"] = origins
+        if angles is not None:
+            columns["angles"] = angles
+        keys = list(columns)
+        for key in keys:
+            if not key in template.defaults:
+                raise KeyError(key + ' does not exist in ' + classname)
+            if len(columns[key]) != len(origins):
+                raise ValueError("%s has %i values for %i entities" % (key, len(columns[key]), len(origins)))
+
+        values = []
+        for key in keys:
+            column = columns[key]
+            if isinstance(column, numpy.ndarray):
+                column = column.tolist()
+            values.append(column)
+        
+        # same as the constructor, without looking up the template or
+        # checking property names per entity
+        entities = []
+        for row in zip(*values):
+            entity = Entity.__new__(Entity)
+            entity._initialize(parent, classname, template, dict(zip(keys, row)))
+            entities.append(entity)
+        parent.entities.extend(entities)
+        return entities
+
     ## Generate unique ID for a Solid associated with this Entity
     def generateId(self):
         return self.parent.generateId()
+
+    ## INTERNAL! Get the shared defaults of an entity class, building them
+    #  from the FGD the first time.
+    @staticmethod
+    def _getTemplate(gameId, classname):
+        key = (gameId, classname)
+        if key not in Entity._templates:
+            Entity._templates[key] = Entity._Template(FGD.getGameFGD(gameId)[classname])
+        return Entity._templates[key]
+
+    ## INTERNAL! Apply transformations recorded while VMF.deferTransforms was
+    #  set.
+    def _applyPendingTransforms(self):
+        pending = self._pendingTransforms
+        self._pendingTransforms = []
+        for transform in pending:
+            Entity._transformSpatialPropertiesMany([self], transform)
+
+    ## INTERNAL! Get a property value for reading only. Unlike properties,
+    #  list defaults are not copied and pending transformations are not
+    #  applied.
+    def _getProperty(self, name):
+        if name in self._properties:
+            return self._properties[name]
+        return self._template.defaults[name]
+
+    def _getProperties(self):
+        if self._pendingTransforms:
+            self._applyPendingTransforms()
+        return Entity._SparseDict(self._properties, self._template.defaults)
+
+    def _setProperties(self, properties):
+        if self._pendingTransforms:
+            self._applyPendingTransforms()
+        self._properties = dict(properties)
+    ## entity properties. Only values that are set, or list defaults that are
+    #  modified in place, are stored on the entity; the rest are read from the
+    #  defaults. Any deferred transformations are applied before the
+    #  properties are returned.
+    properties = property(fget=_getProperties, fset=_setProperties)
+
+    def _getOutputs(self):
+        return Entity._SparseDict(self._outputs, self._template.outputs)
+
+    def _setOutputs(self, outputs):
+        self._outputs = {key: value for key, value in outputs.items() if value}
+    ## outputs to other entities, as lists of Output by event name. Used to
+    #  trigger things, etc. Only outputs whose lists have been modified are
+    #  stored on the entity. Reading an output without connections does not
+    #  store it.
+    outputs = property(fget=_getOutputs, fset=_setOutputs)
+
+    def _getDeferTransforms(self):
+        return self.parent.deferTransforms
+    ## whether transformations of this entity and its solids are deferred
+    #  @sa VMF.deferTransforms
+    deferTransforms = property(fget=_getDeferTransforms)
     
     def getPropertyNames(self):
-        return self.properties.keys()
+        return self._template.defaults.keys()
 
     ## can get the value of entity properties using Entity[propName]
     def __getitem__(self, key):
@@ -1476,9 +2400,13 @@ class Entity(object):
 
     ## can set the value of entity properties using Entity[propName] = newvalue
     def __setitem__(self, key, value):
-        if not key in self.properties.keys():
+        if not key in self._template.defaults:
             raise KeyError(key + ' does not exist in ' + self.classname)
-        self.properties[key] = value
+        #the value is already in its final place, so earlier transformations
+        #must not be applied to it later
+        if self._pendingTransforms:
+            self._applyPendingTransforms()
+        self._properties[key] = value
 
     ## INTERNAL! Create Entity from key-value dictionary. Used in parsing VMF files.
     @classmethod
@@ -1542,8 +2470,6 @@ class Entity(object):
                             entity.properties[parameter.name] = entityKVD[parameter.name][0]
                 else:
                     entity.properties[parameter.name] = entityKVD[parameter.name][0]
-            else:
-                entity.properties[parameter.name] = parameter.default
         
           
         if "origin" in entityKVD.keys():
@@ -1580,73 +2506,34 @@ class Entity(object):
                     solid = Solid.fromKVD(entity, solidKVD)
 
     ## INTERNAL!! export to key-value list format. Used in saving VMF files
-    def toKVL(self):
+    #
+    #  @param displacementRows optional preformatted rows from Side.formatDisplacements()
+    def toKVL(self, displacementRows=None):
         entityKVL = KeyValueList()
         entityKVL.add("id", str(self.id))
         entityKVL.add("classname", self.classname)
         
-        if "origin" in self.properties:
-            entityKVL.add(
-                "origin",
-                "%g %g %g" % tuple(self.properties["origin"])
-                )
+        self._applyPendingTransforms()
+        entityKVL.add(
+            "origin",
+            "%g %g %g" % tuple(self._getProperty("origin"))
+            )
         
-        definition = FGD.getGameFGD(self.parent.gameId)[self.classname]
-        for parameter in definition.parameters:
-            if parameter.name == "origin":
-                pass
-            elif parameter.type in (FGD.INTEGER, FGD.FLOAT):
-                entityKVL.add(
-                    parameter.name,
-                    "%g " % self.properties[parameter.name]
-                    )
-            elif parameter.type in (FGD.INTEGER_LIST, FGD.VECTOR, FGD.FLOAT_LIST):
-                valueStr = ""
-                for value in self.properties[parameter.name]:
-                    valueStr += "%g " % value
-                
-                entityKVL.add(
-                    parameter.name,
-                    valueStr
-                    )
-            elif parameter.type == FGD.ANGLE:
-                # Change angle order from XYZ to YZX. (The VMF rotation order is actually XYZ, but is stored in YZX order.)
-                # The y axis is also reversed
-                entityKVL.add(
-                    parameter.name,
-                    "%g %g %g" % (-self.properties[parameter.name][1],
-                                  self.properties[parameter.name][2],
-                                  self.properties[parameter.name][0])
-                    )
-            elif parameter.type == FGD.AXIS:                
-                valueStr = ""
-                if type(self.properties[parameter.name][0]) == list:
-                    for valueList in self.properties[parameter.name][:-1]:
-                        for value in valueList[:-1]:
-                            valueStr += "%g " % value
-                        valueStr += str(valueList[-1])
-                        valueStr += ", "
-                        
-                    for value in self.properties[parameter.name][-1][:-1]:
-                        valueStr += "%g " % value
-                    valueStr += str(self.properties[parameter.name][-1][-1])
-                else:
-                    for value in self.properties[parameter.name]:
-                        valueStr += "%g " % value
-                
-                entityKVL.add(
-                    parameter.name,
-                    valueStr
-                    )
-            elif self.properties[parameter.name] != None and len(str(self.properties[parameter.name])) > 0:
-                entityKVL.add(
-                    parameter.name,
-                    str(self.properties[parameter.name])
-                    )
+        overrides = self._properties
+        for name, format, default in self._template.getSerializer():
+            if name in overrides:
+                value = format(overrides[name])
+            elif default is Entity._Template.UNFORMATTED:
+                value = format(self._template.defaults[name])
+            else:
+                value = default
+            if value != None:
+                entityKVL.add(name, value)
         
         connectionsKVL = KeyValueList()
-        for output in self.outputs.keys():
-            for connection in self.outputs[output]:
+        order = self._template.outputOrder
+        for output in sorted(self._outputs, key=lambda x: order.get(x, len(order))):
+            for connection in self._outputs[output]:
                 if connection.parameters == None:
                     parameters = ""
                 else:
@@ -1664,7 +2551,7 @@ class Entity(object):
         entityKVL.add("connections", connectionsKVL)
         
         for solid in self.solids:
-            solidKVL = solid.toKVL()
+            solidKVL = solid.toKVL(displacementRows)
             entityKVL.add("solid", solidKVL)
         
         return entityKVL
@@ -1679,24 +2566,96 @@ class Entity(object):
     #
     #  @sa Matrix
     def transform(self, transform, materialLock=False, materialScaleLock=False, origin=None):
-        if origin == None:
-            origin = self.properties["origin"]
+        if self.deferTransforms:
+            if origin == None:
+                origin = self._getProperty("origin") # origin is kept current when deferring
+            for solid in self.solids:
+                solid.transform(transform, materialLock, materialScaleLock, origin)
+            self._properties["origin"] = transform.transformVector(self._getProperty("origin"))
+            self._pendingTransforms.append(transform)
+        else:
+            Entity.transformMany([self], transform, materialLock, materialScaleLock, origin)
+
+    ## transform many entities using one transformation matrix
+    #
+    #  The sides of all the entities' solids are transformed in one batch, and
+    #  so are their origins, vectors and angles. The result is the same as
+    #  calling transform() on each entity.
+    #
+    #  @param entities list of Entities
+    #  @param transform a 4x4 transformation matrix
+    #  @param materialLock If true, textures are transformed with the solids (if any).
+    #  (Hammer calls it texture lock.)
+    #  @param materialScaleLock If true, textures scale with the solids (if any).
+    #  @param origin optional transformation origin to override each entity's
+    #  origin
+    #
+    #  @sa Matrix
+    @staticmethod
+    def transformMany(entities, transform, materialLock=False, materialScaleLock=False, origin=None):
+        batch = []
+        for entity in entities:
+            if entity.deferTransforms:
+                entity.transform(transform, materialLock, materialScaleLock, origin)
+            else:
+                batch.append(entity)
+        
         #transform solids
-        for solid in self.solids:
-            solid.transform(transform, materialLock, materialScaleLock, origin)
-        #transform spatial properties
-        self.properties["origin"] = transform.transformVector(self.properties["origin"])
-        for parameter in FGD.getGameFGD(self.parent.gameId)[self.classname].parameters:
-            if parameter.name == "origin":
-                pass
-            elif parameter.name in self.properties:
-                if parameter.type is FGD.VECTOR:
-                    self.properties[parameter.name] = transform.transformVector(self.properties[parameter.name])
-                elif parameter.type is FGD.AXIS:
-                    for x in range(len(self.properties[parameter.name])):
-                        self.properties[parameter.name][x] = transform.transformVector(self.properties[parameter.name][x])
-                elif parameter.type is FGD.ANGLE:
-                    self.properties[parameter.name] = transform.transformAngles(self.properties[parameter.name])
+        sides = []
+        sideOrigins = []
+        for entity in batch:
+            if entity._pendingTransforms:
+                entity._applyPendingTransforms()
+            entityOrigin = entity._getProperty("origin") if origin == None else origin
+            for solid in entity.solids:
+                sides += solid.sides
+                sideOrigins += [entityOrigin]*len(solid.sides)
+                solid.origin = transform.transformVector(entityOrigin)
+        if sides:
+            Side.transformMany(sides, transform, materialLock, materialScaleLock, sideOrigins)
+        
+        Entity._transformPropertiesMany(batch, transform)
+
+    ## INTERNAL! transform the spatial properties of entities, but not their
+    #  solids
+    @staticmethod
+    def _transformPropertiesMany(entities, transform):
+        if not entities:
+            return
+        origins = transform.transformPoints(
+            [entity._getProperty("origin") for entity in entities]
+            )
+        for entity, origin in zip(entities, origins.tolist()):
+            entity._properties["origin"] = origin
+        Entity._transformSpatialPropertiesMany(entities, transform)
+
+    ## INTERNAL! transform the spatial properties of entities other than
+    #  origin. Vectors and angles of all the entities are transformed in one
+    #  batch each. Only the properties listed by each entity's template are
+    #  read.
+    @staticmethod
+    def _transformSpatialPropertiesMany(entities, transform):
+        vectors = []
+        angles = []
+        for entity in entities:
+            template = entity._template
+            for name in template.vectors:
+                vectors.append((entity, name))
+            for name in template.axes:
+                axis = entity.properties[name]
+                for x in range(len(axis)):
+                    axis[x] = transform.transformVector(axis[x])
+            for name in template.angles:
+                angles.append((entity, name))
+        
+        if vectors:
+            values = transform.transformPoints([e._getProperty(name) for e, name in vectors])
+            for (entity, name), value in zip(vectors, values.tolist()):
+                entity._properties[name] = value
+        if angles:
+            values = transform.transformAnglesMany([e._getProperty(name) for e, name in angles])
+            for (entity, name), value in zip(angles, values.tolist()):
+                entity._properties[name] = value
 
 ## A special four by four matrix for transformations such as scaling, rotation,
 #  and translation.
@@ -1712,12 +2671,8 @@ class Matrix:
     ## Constructor. Creates identity matrix. If applied, this transformation
     #  matrix does nothing.
     def __init__(self):
-        self._matrix = [
-            [1.0,0.0,0.0,0.0],
-            [0.0,1.0,0.0,0.0],
-            [0.0,0.0,1.0,0.0],
-            [0.0,0.0,0.0,1.0]
-            ]
+        ## 4x4 numpy array
+        self._matrix = numpy.identity(4)
 
     ## Create transformation matrix that scales.
     #
@@ -1730,12 +2685,12 @@ class Matrix:
     def fromScale(x, y, z):
         matrix = Matrix()
         
-        matrix._matrix = [
+        matrix._matrix = numpy.array([
             [float(x),0.0,0.0,0.0],
             [0.0,float(y),0.0,0.0],
             [0.0,0.0,float(z),0.0],
             [0.0,0.0,0.0,1.0]
-            ]
+            ])
 
         return matrix
 
@@ -1750,12 +2705,12 @@ class Matrix:
     def fromTranslate(x, y, z):
         matrix = Matrix()
         
-        matrix._matrix = [
+        matrix._matrix = numpy.array([
             [1.0,0.0,0.0,float(x)],
             [0.0,1.0,0.0,float(y)],
             [0.0,0.0,1.0,float(z)],
             [0.0,0.0,0.0,1.0]
-            ]
+            ])
 
         return matrix
 
@@ -1788,12 +2743,12 @@ class Matrix:
         
         ## @todo optimize
         
-        matrix._matrix = [
+        matrix._matrix = numpy.array([
             [cy*cz, -cy*sz, sy, 0.0],
             [cx*sz + cz*sx*sy, cx*cz - sx*sy*sz, -cy*sx, 0.0],
             [sx*sz - cx*cz*sy, cz*sx + cx*sy*sz, cx*cy, 0.0],
-            [0.0, 0.0, 0.0, 0.0]
-            ]
+            [0.0, 0.0, 0.0, 1.0]
+            ])
 
         return matrix
 
@@ -1807,12 +2762,12 @@ class Matrix:
     def fromXAngle(x):
         matrix = Matrix()
         
-        matrix._matrix = [
+        matrix._matrix = numpy.array([
             [1.0,0.0,0.0,0.0],
             [0.0,math.cos(x),-math.sin(x),0.0],
             [0.0,math.sin(x),math.cos(x),0.0],
             [0.0,0.0,0.0,1.0]
-            ]
+            ])
 
         return matrix
 
@@ -1826,12 +2781,12 @@ class Matrix:
     def fromYAngle(y):
         matrix = Matrix()
         
-        matrix._matrix = [
+        matrix._matrix = numpy.array([
             [math.cos(y),0.0,-math.sin(y),0.0],
             [0.0,1.0,0.0,0.0],
             [math.sin(y),0.0,math.cos(y),0.0],
             [0.0,0.0,0.0,1.0]
-            ]
+            ])
 
         return matrix
 
@@ -1845,12 +2800,12 @@ class Matrix:
     def fromZAngle(z):
         matrix = Matrix()
         
-        matrix._matrix = [
+        matrix._matrix = numpy.array([
             [math.cos(z),-math.sin(z),0.0,0.0],
             [math.sin(z),math.cos(z),0.0,0.0],
             [0.0,0.0,1.0,0.0],
             [0.0,0.0,0.0,1.0]
-            ]
+            ])
 
         return matrix
 
@@ -1863,27 +2818,29 @@ class Matrix:
     #  @return result of multiplication
     def __mul__(self, other):
         result = Matrix()
-        for y in range(4):
-            for x in range(4):
-                v = [self._matrix[y][i]*other._matrix[i][x] for i in range(4)]
-                result._matrix[y][x] = sum(v)
+        result._matrix = Matrix._multiplyMany(self._matrix, other._matrix)
         return result
 
+    ## INTERNAL! Multiply arrays of 4x4 matrices. The arrays broadcast against
+    #  each other. Summed term by term, in the same order as a row-times-column
+    #  loop.
+    @staticmethod
+    def _multiplyMany(a, b):
+        return sum(a[...,:,i,None]*b[...,None,i,:] for i in range(4))
+
     ## Apply matrix transformation to texture axis
     #
     #  @param axis texture axis
     #  @return modified texture axis
     def rotateVector(self, axis):
-        x = self._matrix[0][0]*axis[0] + \
-            self._matrix[0][1]*axis[1] + \
-            self._matrix[0][2]*axis[2]
-        y = self._matrix[1][0]*axis[0] + \
-            self._matrix[1][1]*axis[1] + \
-            self._matrix[1][2]*axis[2]
-        z = self._matrix[2][0]*axis[0] + \
-            self._matrix[2][1]*axis[1] + \
-            self._matrix[2][2]*axis[2]
-        return [x,y,z]
+        return Matrix._applyMany(self._matrix, numpy.array(axis, float), False).tolist()
+
+    ## Apply matrix transformation, without translation, to many vectors
+    #
+    #  @param vectors array of (x,y,z) vectors, any shape ending in 3
+    #  @return numpy array of modified vectors
+    def rotateVectors(self, vectors):
+        return Matrix._applyMany(self._matrix, numpy.asarray(vectors, float), False)
 
     ### Apply only translation part of matrix transformation to a point
     ##
@@ -1900,20 +2857,85 @@ class Matrix:
     #  @param point 3D coordinate to transform
     #  @return modified 3D coordinate
     def transformVector(self, point):
-        x = self._matrix[0][0]*point[0] + \
-            self._matrix[0][1]*point[1] + \
-            self._matrix[0][2]*point[2] + \
-            self._matrix[0][3]
-        y = self._matrix[1][0]*point[0] + \
-            self._matrix[1][1]*point[1] + \
-            self._matrix[1][2]*point[2] + \
-            self._matrix[1][3]
-        z = self._matrix[2][0]*point[0] + \
-            self._matrix[2][1]*point[1] + \
-            self._matrix[2][2]*point[2] + \
-            self._matrix[2][3]
-        return [x,y,z]
-    
+        return Matrix._applyMany(self._matrix, numpy.array(point, float), True).tolist()
+
+    ## Apply full matrix transformation to many points
+    #
+    #  @param points array of 3D coordinates, any shape ending in 3
+    #  @return numpy array of modified 3D coordinates
+    def transformPoints(self, points):
+        return Matrix._applyMany(self._matrix, numpy.asarray(points, float), True)
+
+    ## INTERNAL! Apply 4x4 matrices to an array of vectors. The matrices
+    #  broadcast against the vectors. Each component is summed in x, y, z,
+    #  translation order so batched and single results are identical.
+    #
+    #  @param matrices array of 4x4 matrices
+    #  @param vectors array of vectors, any shape ending in 3
+    #  @param translate whether to add the translation column
+    @staticmethod
+    def _applyMany(matrices, vectors, translate):
+        result = numpy.empty(numpy.broadcast_shapes(matrices.shape[:-2], vectors.shape[:-1]) + (3,))
+        for row in range(3):
+            value = matrices[...,row,0]*vectors[...,0] + \
+                    matrices[...,row,1]*vectors[...,1] + \
+                    matrices[...,row,2]*vectors[...,2]
+            if translate:
+                value = value + matrices[...,row,3]
+            result[...,row] = value
+        return result
+
+    ## Apply full matrix transformation to many entity angles at once
+    #
+    #  Gives the same results as calling transformAngles() on each one.
+    #
+    #  @param angles array of entity "angles" parameter values, shape (n, 3)
+    #  @return numpy array of modified angles parameters
+    def transformAnglesMany(self, angles):
+        angles = numpy.radians(numpy.asarray(angles, float).reshape(-1, 3))
+        cos = numpy.cos(angles)
+        sin = numpy.sin(angles)
+        
+        x = numpy.broadcast_to(numpy.identity(4), (len(angles), 4, 4)).copy()
+        y = x.copy()
+        z = x.copy()
+        x[:,1,1] = cos[:,0]
+        x[:,1,2] = -sin[:,0]
+        x[:,2,1] = sin[:,0]
+        x[:,2,2] = cos[:,0]
+        y[:,0,0] = cos[:,1]
+        y[:,0,2] = -sin[:,1]
+        y[:,2,0] = sin[:,1]
+        y[:,2,2] = cos[:,1]
+        z[:,0,0] = cos[:,2]
+        z[:,0,1] = -sin[:,2]
+        z[:,1,0] = sin[:,2]
+        z[:,1,1] = cos[:,2]
+        matrix = Matrix._multiplyMany(
+            self._matrix,
+            Matrix._multiplyMany(Matrix._multiplyMany(z, y), x)
+            )
+        
+        # decompose into XYZ order euler angles, see transformAngles()
+        # math.atan2 and math.asin are used so results match transformAngles()
+        # to the last bit
+        m = lambda x : matrix[:,int(x/10),x%10].tolist()
+        atan2 = lambda a, b : numpy.array(list(map(math.atan2, a, b)), float)
+        m02 = matrix[:,0,2]
+        inside = (m02 < 1) & (m02 > -1)
+        x = numpy.where(
+            inside,
+            atan2((-matrix[:,1,2]).tolist(), m(22)),
+            numpy.where(m02 < 1, -1, 1)*atan2(m(10), m(11))
+            )
+        y = numpy.where(
+            inside,
+            numpy.array(list(map(math.asin, numpy.clip(m02, -1, 1).tolist())), float),
+            numpy.where(m02 < 1, -math.pi/2, math.pi/2)
+            )
+        z = numpy.where(inside, atan2((-matrix[:,0,1]).tolist(), m(0)), 0.0)
+        
+        return numpy.degrees(numpy.stack([x, y, z], axis=1))
     
     ## Apply full matrix transformation to entity angles
     #
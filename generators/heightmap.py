@@ -54,6 +54,8 @@ class HeightMapConfig(ConfigGUI):
         self.material.set("dev/dev_blendmeasure2")
         self.maxHeight = IntVar()
         self.maxHeight.set(1024)
+        self.vertexBudget = IntVar()
+        self.vertexBudget.set(0)
         self.skyHeight = IntVar()
         self.skyHeight.set(1024)
         self.waterEnabled = BooleanVar()
@@ -188,6 +190,22 @@ class HeightMapConfig(ConfigGUI):
 
         row += 1
 
+        # vertex budget, 0 for fixed displacement power. A budget changes the
+        # terrain layout, see HeightMap.vertexBudget
+        Label(entryFrame, text="Vertex budget:").grid(
+            column=0,
+            row=row,
+            **style
+            )
+
+        Entry(entryFrame, textvariable=self.vertexBudget, width=6).grid(
+            column=1,
+            row=row,
+            **style
+            )
+
+        row += 1
+
         # Sky height
         Label(entryFrame, text="Sky height:").grid(
             column=0,
@@ -433,6 +451,10 @@ class HeightMapConfig(ConfigGUI):
             self.parent.alphaPath = None
         self.parent.material = self.material.get()
         self.parent.maxHeight = self.maxHeight.get()
+        if self.vertexBudget.get() > 0:
+            self.parent.vertexBudget = self.vertexBudget.get()
+        else:
+            self.parent.vertexBudget = None
         self.parent.skyHeight = self.skyHeight.get()
         if self.waterEnabled.get():
             self.parent.waterHeight = self.waterHeight.get()
@@ -655,6 +677,9 @@ class HeightMap(Generator):
     POWER = 2
     EDGE_NUM = 2**POWER
     VERTEX_NUM = EDGE_NUM + 1
+    ## Highest displacement power when a vertex budget is used. The heightmap
+    #  is then cut into tiles of 2**MAX_POWER pixels, instead of 2**POWER.
+    MAX_POWER = 4
 
     class Exclusion:
         def __init__(self, pos, radius):
@@ -665,6 +690,19 @@ class HeightMap(Generator):
     def __init__(self, parent):
         Generator.__init__(self, parent)
         self.size = 2048
+        ## Total number of displacement vertices, or None to give every
+        #  displacement power POWER.
+        #
+        #  With a budget, each displacement covers 2**MAX_POWER heightmap
+        #  pixels and its power is lowered where the terrain is flat, so the
+        #  terrain has fewer, larger displacements than without one. POWER is
+        #  already the lowest power, so the layout without a budget has no
+        #  power to spare. The displacement grid and origins differ between
+        #  the two modes, and the heightmap is cropped to a whole number of
+        #  displacements, which can leave more of its edge unused with a
+        #  budget. Props are only placed on the pixels that are used, and
+        #  their positions are scaled to the displacement size.
+        self.vertexBudget = None
         #self.layerPaths = []
         #self.props = []
 
@@ -694,48 +732,52 @@ class HeightMap(Generator):
         heightmap = heightmap*(self.maxHeight/256)
 
         # Generate displacements       
-        dispNum = int((len(heightmap)-1)/self.EDGE_NUM)
+        if self.vertexBudget == None:
+            power = self.POWER
+        else:
+            power = self.MAX_POWER
+        edgeNum = 2**power
+        dispNum = int((len(heightmap)-1)/edgeNum)
         dispSize = int(self.size/dispNum)
         
-        self.listenerWrite(
-            "Adding %i power %i displacements of size %i.\n" %
-            (dispNum*dispNum, self.POWER, dispSize)
-            )
-        for y in range(0, dispNum):
-            for x in range(0, dispNum):
-                solid = Solid.fromMinMax(
-                    vmf,
-                    [x*dispSize,y*dispSize,-128],
-                    [(x+1)*dispSize,(y+1)*dispSize,0],
-                    self.material
-                    )
-                solid.sides[0].power = self.POWER
-
-                for u in range(0, self.VERTEX_NUM):
-                    for v in range(0, self.VERTEX_NUM):
-                        i = x*self.EDGE_NUM + u
-                        j = y*self.EDGE_NUM + v
-                        
-                        # Set displacement height
-                        solid.sides[0].displacement[u][v][2] = int(heightmap[i,j][0])
-
-                        # Set alpha value
-                        if self.alphaPath != None:
-                            solid.sides[0].alpha[u][v] = int(
-                                alpha[i, j][0]
-                                )
-                        else:
-                            solid.sides[0].alpha[u][v] = self.alphaScalar
+        if self.vertexBudget == None:
+            self.listenerWrite(
+                "Adding %i power %i displacements of size %i.\n" %
+                (dispNum*dispNum, power, dispSize)
+                )
+        else:
+            self.listenerWrite(
+                "Adding %i displacements of size %i with a budget of %i vertices.\n" %
+                (dispNum*dispNum, dispSize, self.vertexBudget)
+                )
+        used = dispNum*edgeNum + 1
+        if self.alphaPath != None:
+            alphas = alpha[:used, :used, 0].astype(int)
+        else:
+            alphas = self.alphaScalar
+        Solid.terrainFromArray(
+            vmf,
+            [0, 0, 0],
+            dispSize,
+            heightmap[:used, :used, 0].astype(int),
+            alphas,
+            power,
+            self.material,
+            vertexBudget=self.vertexBudget
+            )
         
         self.listenerWrite("Finished adding displacements.\n")
 
         # Add props
         propNum = 0
-        vertexSize = dispSize/self.EDGE_NUM
+        vertexSize = dispSize/edgeNum
         exclusions = []
         for prop in self.props:
-            for y in range(0, len(heightmap)):
-                for x in range(0, len(heightmap)):                        
+            origins = []
+            angles = []
+            # only the pixels covered by displacements
+            for y in range(0, used):
+                for x in range(0, used):
                     if (prop.layer == None or random.random()*256 < layers[prop.layer][x,y][0]) and \
                        random.random() < prop.probability:
                         pos = [
@@ -757,15 +799,16 @@ class HeightMap(Generator):
                                 break
 
                         if canAdd:                           
-                            entity = Entity(vmf, prop.type)
-                            entity["origin"] = pos
-                            entity["angles"] = [0, 0, random.randrange(0,360)]
-                            entity["model"] = prop.model
+                            origins.append(pos)
+                            angles.append([0, 0, random.randrange(0,360)])
 
                             if prop.radius > 0:
                                 exclusions.append(self.Exclusion(pos, prop.radius))
-                            
-                            propNum += 1
+
+            if origins:
+                Entity.createMany(vmf, prop.type, origins, angles,
+                                  model=[prop.model]*len(origins))
+                propNum += len(origins)
 
         self.listenerWrite("Added %i props.\n" % propNum)
 
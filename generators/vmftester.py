@@ -1,4 +1,5 @@
 import random
+import numpy
 
 from generators.generator import Generator
 from generators.testpattern import *
@@ -295,11 +296,12 @@ class TestVMF(Generator):
         radius = 128
         height = 92
         base = -36
-        distance = math.sqrt((center[0]-x)**2 + (center[1]-y)**2)
-        if distance > radius:
-            return base
-        else:
-            return (math.cos(math.pi * distance/radius)+1) * height/2 + base
+        distance = numpy.sqrt((center[0]-x)**2 + (center[1]-y)**2)
+        return numpy.where(
+            distance > radius,
+            base,
+            (numpy.cos(numpy.pi * distance/radius)+1) * height/2 + base
+            )
 
     def _testFromHeightFunction(self):
         power = 4
@@ -308,47 +310,35 @@ class TestVMF(Generator):
         #put a block in the hole in the middle
         Solid.from3DRect(self.native, (center[0]-32,center[1]-32,-32), (64,64,80), self.map.textureWall)
         
-        Solid.fromHeightFunction(
-            self.native,
-            power,
-            [
-                [center[0]-128,center[1]-128],
-                [center[0]-32,center[1]-32],
-                [center[0]+32,center[1]-32],
-                [center[0]+128,center[1]-128]
-                ],
-            TestVMF._heightFunction,
-            self.map.textureStone)
-        Solid.fromHeightFunction(
-            self.native,
-            power,
-            [
-                [center[0]-128,center[1]-128],
-                [center[0]-128,center[1]+128],
-                [center[0]-32,center[1]+32],
-                [center[0]-32,center[1]-32]
-                ],
-            TestVMF._heightFunction,
-            self.map.textureStone)
-        Solid.fromHeightFunction(
-            self.native,
-            power,
-            [
-                [center[0]-32,center[1]+32],
-                [center[0]-128,center[1]+128],
-                [center[0]+128,center[1]+128],
-                [center[0]+32,center[1]+32]
-                ],
-            TestVMF._heightFunction,
-            self.map.textureStone)
-        Solid.fromHeightFunction(
+        Solid.fromHeightFunctionMany(
             self.native,
             power,
             [
-                [center[0]+32,center[1]-32],
-                [center[0]+32,center[1]+32],
-                [center[0]+128,center[1]+128],
-                [center[0]+128,center[1]-128]
+                [
+                    [center[0]-128,center[1]-128],
+                    [center[0]-32,center[1]-32],
+                    [center[0]+32,center[1]-32],
+                    [center[0]+128,center[1]-128]
+                    ],
+                [
+                    [center[0]-128,center[1]-128],
+                    [center[0]-128,center[1]+128],
+                    [center[0]-32,center[1]+32],
+                    [center[0]-32,center[1]-32]
+                    ],
+                [
+                    [center[0]-32,center[1]+32],
+                    [center[0]-128,center[1]+128],
+                    [center[0]+128,center[1]+128],
+                    [center[0]+32,center[1]+32]
+                    ],
+                [
+                    [center[0]+32,center[1]-32],
+                    [center[0]+32,center[1]+32],
+                    [center[0]+128,center[1]+128],
+                    [center[0]+128,center[1]-128]
+                    ]
                 ],
             TestVMF._heightFunction,
-            self.map.textureStone)
\ No newline at end of file
+            self.map.textureStone,
+            vectorized=True)
\ No newline at end of file
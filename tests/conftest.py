@@ -0,0 +1,137 @@
+import os, sys
+
+import pytest
+
+#code execution must start from the root folder (LevelGen) for imports to work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gameids
+from formats.fgd import FGD
+from formats.vmf import Entity
+from formats.sdkutil import SDKUtil
+from formats.sdkexecutor import SDKExecutor
+from progressobserver import ProgressObserver
+
+## entity definitions used in place of a game's FGD
+_FGD = '''
+@BaseClass = Targetname
+[
+	targetname(target_source) : "Name"
+	output OnUser1(void) : "Fired in response to FireUser1 input"
+]
+
+@BaseClass = Origin
+[
+	origin(origin) : "Origin (X Y Z)"
+]
+
+@BaseClass = Angles
+[
+	angles(angle) : "Pitch Yaw Roll (Y Z X)" : "0 0 0"
+]
+
+@PointClass base(Targetname, Angles, Origin) = prop_static : "A prop that doesn't move."
+[
+	model(studio) : "World Model" : "models/error.mdl"
+	skin(integer) : "Skin" : 0
+]
+
+@PointClass base(Targetname, Origin) = light : "An invisible omnidirectional lightsource."
+[
+	_light(color255) : "Brightness" : "255 255 255 200"
+]
+
+@PointClass base(Targetname, Angles, Origin) = light_environment : "Sunlight."
+[
+	_light(color255) : "Brightness" : "255 255 255 200"
+]
+'''
+
+## Use a small FGD for HL2 instead of the one installed with the SDK
+@pytest.fixture
+def hl2FGD(tmp_path, monkeypatch):
+    path = tmp_path / 'test.fgd'
+    path.write_text(_FGD)
+    monkeypatch.setattr(FGD, 'cacheDirectory', None)
+    monkeypatch.setitem(FGD._FGDDict, gameids.HL2, FGD(str(path)))
+    monkeypatch.setattr(Entity, '_templates', {})
+    return gameids.HL2
+
+## Stand-in for vbsp.exe, vvis.exe and vrad.exe. Logs when it starts and ends,
+#  prints STANDIN_OUTPUT_<tool>, sleeps STANDIN_SLEEP seconds and fails if
+#  STANDIN_FAIL is "<tool> <map name>".
+_TOOL = '''#!%s
+import os, sys, time
+name = os.path.basename(sys.argv[0])[:-4]
+mapName = os.path.splitext(os.path.basename(sys.argv[-1]))[0]
+def log(event):
+    with open(os.environ['STANDIN_LOG'], 'a') as f:
+        f.write('%%f %%s %%s %%s %%s\\n' %% (time.time(), event, name, mapName, ' '.join(sys.argv[1:-3])))
+log('start')
+sys.stdout.write(os.environ.get('STANDIN_OUTPUT_' + name, ''))
+sys.stdout.flush()
+time.sleep(float(os.environ.get('STANDIN_SLEEP', '0.2')))
+if name == 'vbsp':
+    open(sys.argv[-1][:-3] + 'bsp', 'w').close()
+log('end')
+sys.exit(1 if os.environ.get('STANDIN_FAIL') == name + ' ' + mapName else 0)
+'''
+
+## ProgressObserver that keeps everything it receives
+class Recorder(ProgressObserver):
+    def __init__(self):
+        self.text = []
+        self.progress = []
+        self.status = []
+
+    def write(self, string):
+        self.text.append(string)
+
+    def setProgress(self, progress):
+        self.progress.append(progress)
+
+    def setStatus(self, status):
+        self.status.append(status)
+
+## SDKExecutor for HL2 that runs stand-in compile tools in a temporary SDK
+#  and game directory. Each test gets a Recorder as executor.recorder.
+@pytest.fixture
+def sdkExecutor(tmp_path, monkeypatch):
+    if os.name == 'nt':
+        pytest.skip('stand-in tools are scripts, which need a POSIX system')
+    hammer = tmp_path / 'hammer'
+    (hammer / 'bin').mkdir(parents = True)
+    (tmp_path / 'game').mkdir()
+    for tool in ('vbsp', 'vvis', 'vrad'):
+        path = hammer / 'bin' / (tool + '.exe')
+        path.write_text(_TOOL % sys.executable)
+        path.chmod(0o755)
+    monkeypatch.setattr(SDKUtil, 'findUserAndBasePath', staticmethod(lambda: ('user', str(tmp_path))))
+    monkeypatch.setattr(SDKUtil, 'findHammerPath', staticmethod(lambda gameID: str(hammer)))
+    monkeypatch.setattr(SDKUtil, 'findGamePath', staticmethod(lambda gameID: str(tmp_path / 'game')))
+    monkeypatch.setenv('STANDIN_LOG', str(tmp_path / 'log'))
+    executor = SDKExecutor(gameids.HL2)
+    executor.recorder = Recorder()
+    executor.addListener(executor.recorder)
+    return executor
+
+## Read the stand-in tool log
+#
+#  @return list of (time, event, tool, map name, arguments)
+def readToolLog(executor):
+    path = os.environ['STANDIN_LOG']
+    if not os.path.isfile(path):
+        return []
+    lines = open(path).read().splitlines()
+    return [(float(x[0]), x[1], x[2], x[3], x[4] if len(x) > 4 else '') for x in [y.split(' ', 4) for y in lines]]
+
+## Create empty map files
+#
+#  @return list of paths
+def makeMapFiles(directory, count):
+    paths = []
+    for n in range(count):
+        path = directory / ('map%i.vmf' % n)
+        path.write_text('')
+        paths.append(str(path))
+    return paths
@@ -0,0 +1,181 @@
+import os
+
+import pytest
+
+import gameids
+from formats.fgd import FGD
+
+from conftest import _FGD
+
+
+@pytest.fixture
+def cacheResults(tmp_path, monkeypatch):
+    monkeypatch.setattr(FGD, 'cacheDirectory', str(tmp_path / 'cache'))
+    results = []
+    loadCache = FGD._loadCache
+    def record(self):
+        results.append(loadCache(self))
+        return results[-1]
+    monkeypatch.setattr(FGD, '_loadCache', record)
+    path = tmp_path / 'test.fgd'
+    path.write_text(_FGD)
+    return str(path), results
+
+
+def testCacheUsed(cacheResults):
+    path, results = cacheResults
+    FGD(path)
+    assert oct(os.stat(FGD.cacheDirectory).st_mode & 0o777) == oct(0o700)
+    entity = FGD(path)['prop_static']
+    assert results == [False, True]
+    assert entity.name == 'prop_static'
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason = 'POSIX permissions')
+def testSharedCacheIgnored(cacheResults):
+    path, results = cacheResults
+    FGD(path)
+    #anyone could have planted the cache file
+    os.chmod(FGD.cacheDirectory, 0o777)
+    FGD(path)
+    os.chmod(FGD.cacheDirectory, 0o700)
+    for name in os.listdir(FGD.cacheDirectory):
+        os.chmod(os.path.join(FGD.cacheDirectory, name), 0o666)
+    FGD(path)
+    assert results == [False, False, False]
+
+
+def _describe(entity):
+    return (entity.type, [
+        [(x.name, x.type, x.default) for x in group]
+        for group in (entity.parameters, entity.inputs, entity.outputs)
+        ])
+
+
+def testSnapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(FGD, 'cacheDirectory', None)
+    monkeypatch.setattr(FGD, '_FGDDict', {})
+    path = tmp_path / 'test.fgd'
+    path.write_text(_FGD)
+    parsed = FGD(str(path))
+    snapshotPath = str(tmp_path / 'test.snapshot')
+    parsed.writeSnapshot(snapshotPath)
+
+    snapshot = FGD.fromSnapshot(snapshotPath)
+    assert sorted(snapshot) == sorted(parsed)
+    for name in parsed:
+        assert _describe(snapshot[name]) == _describe(parsed[name])
+
+    FGD.useSnapshot(gameids.HL2, snapshotPath)
+    game = FGD.getGameFGD(gameids.HL2)
+    assert game.filepath == parsed.filepath
+    assert _describe(game['light']) == _describe(parsed['light'])
+
+
+## base classes included by _MAIN_FGD
+_BASE_FGD = '''// base classes shared by the test FGD
+@BaseClass = Targetname
+[
+	targetname(target_source) : "Name" : : "The name that other entities " +
+	"refer to this entity by."
+
+	// Inputs
+	input Kill(void) : "Removes this entity from the world."
+	input SetParent(string) : "Changes the entity's parent."
+
+	// Outputs
+	output OnUser1(void) : "Fired in response to " +
+	"FireUser1 input"
+]
+
+@BaseClass = Origin
+[
+	origin(origin) : "Origin (X Y Z)" : : "The position of this entity's center in the world."
+]
+'''
+
+## a class with every kind of parameter, split strings and comments
+_MAIN_FGD = '''@include "base.fgd"
+@mapsize(-16384, 16384)
+
+// a class with every kind of parameter
+@PointClass base(Targetname, Origin) studio("models/editor/a.mdl") color(255 0 0) = test_entity : "A test " +
+	"entity." +
+	" Split three times."
+[
+	skin(integer) : "Skin" : 3 : "Some models have multiple versions."
+	scale(float) : "Scale" : "1.5"
+	angles(angle) : "Pitch Yaw Roll (Y Z X)" : "0 90 0" // trailing comment
+	rendercolor(color255) : "Color (R G B)" : "255 128 0"
+	solid(choices) : "Collisions" : 6 : "How it collides." =
+	[
+		0: "Not Solid"
+		2: "Use Bounding Box"
+		6: "Use VPhysics"
+	]
+	spawnflags(flags) =
+	[
+		1 : "Start asleep" : 0
+		4 : "Debris" : 1
+		256 : "Motion" : 1
+	]
+	message(string) : "Message" : "Hello : world"
+
+	input SetSkin(integer) : "Changes the skin."
+	output OnBreak(void) : "Fired when " +
+		"broken."
+]
+
+@SolidClass base(Targetname) = test_brush : "A brush."
+[
+	speed(integer) : "Speed" : 100
+]
+'''
+
+
+def testParser(tmp_path, monkeypatch):
+    monkeypatch.setattr(FGD, 'cacheDirectory', None)
+    (tmp_path / 'base.fgd').write_text(_BASE_FGD)
+    path = tmp_path / 'main.fgd'
+    path.write_text(_MAIN_FGD)
+    fgd = FGD(str(path))
+    assert sorted(fgd) == ['Origin', 'Targetname', 'test_brush', 'test_entity']
+
+    # the same values the line based parser found
+    targetname = [('targetname', FGD.STRING, '')]
+    inputs = [('kill', FGD.VOID, None), ('setparent', FGD.STRING, '')]
+    outputs = [('onuser1', FGD.VOID, None)]
+    assert _describe(fgd['Targetname']) == ('@BaseClass', [targetname, inputs, outputs])
+    assert _describe(fgd['test_brush']) == ('@SolidClass', [
+        targetname + [('speed', FGD.INTEGER, 100)], inputs, outputs
+        ])
+    assert _describe(fgd['test_entity']) == ('@PointClass', [
+        targetname + [
+            ('origin', FGD.VECTOR, [0.0, 0.0, 0.0]),
+            ('skin', FGD.INTEGER, 3),
+            ('scale', FGD.FLOAT, 1.5),
+            ('angles', FGD.ANGLE, [0.0, 90.0, 0.0]),
+            ('rendercolor', FGD.INTEGER_LIST, [255, 128, 0]),
+            ('solid', FGD.CHOICE, 6),
+            ('spawnflags', FGD.INTEGER, 260),
+            ('message', FGD.STRING, 'Hello : world')
+            ],
+        inputs + [('setskin', FGD.INTEGER, 0)],
+        outputs + [('onbreak', FGD.VOID, None)]
+        ])
+
+    entity = fgd['test_entity']
+    parameters = {x.name: x for x in entity.parameters + entity.inputs + entity.outputs}
+    assert parameters['solid'].choices == {0: 'Not Solid', 2: 'Use Bounding Box', 6: 'Use VPhysics'}
+    assert parameters['spawnflags'].choices == {1: 'Start asleep', 4: 'Debris', 256: 'Motion'}
+
+    # strings are text, not placeholders
+    assert entity.description == 'A test entity. Split three times.'
+    assert entity.display == [
+        ['base', ['Targetname', 'Origin']],
+        ['studio', ['models/editor/a.mdl']],
+        ['color', ['255 0 0']]
+        ]
+    assert parameters['targetname'].description == 'The name that other entities refer to this entity by.'
+    assert parameters['onuser1'].summary == 'Fired in response to FireUser1 input'
+    assert parameters['onbreak'].summary == 'Fired when broken.'
@@ -0,0 +1,51 @@
+import gameids
+from formats.vmf import Solid
+from formats.vmfmap import VMFMap
+from formats.radplanner import RADPlanner
+
+
+def _terrainMap(path):
+    terrain = VMFMap(path, gameids.HL2)
+    heights = [[x*y for x in range(17)] for y in range(17)]
+    Solid.fromHeightMap(terrain.getNative(), (0, 0, -64), (1024, 1024, 32), heights, 'nature/grass')
+    Solid.fromMinMax(terrain.getNative(), [0, 0, 4096], [1024, 1024, 4112], 'tools/toolsskybox')
+    terrain.save()
+    return terrain
+
+
+def testMeasureDisplacements(tmp_path):
+    terrain = _terrainMap(str(tmp_path / 'terrain.vmf'))
+    luxels, lights, displacements, sun = RADPlanner.measure(terrain.getNative())
+    assert displacements == 1
+    assert luxels == 1024*1024/16.0**2
+    assert (lights, sun) == (0, False)
+
+
+def testPlanBudgets(tmp_path):
+    terrain = _terrainMap(str(tmp_path / 'terrain.vmf'))
+    planner = RADPlanner()
+    preset, estimate = planner.plan([terrain.getNative()], 1e9)
+    assert preset == RADPlanner.presets[0]
+    preset, estimate = planner.plan([terrain.getNative()], 0)
+    assert preset == RADPlanner.presets[-1]
+
+
+def testCompileTerrainWithBudget(sdkExecutor, tmp_path):
+    terrain = _terrainMap(str(tmp_path / 'terrain.vmf'))
+    sdkExecutor.radTimeBudget = 0
+    sdkExecutor.setMapList([str(tmp_path / 'terrain.vmf')], [terrain])
+    sdkExecutor.compile()
+    assert 'Lighting estimated' in ''.join(sdkExecutor.recorder.text)
+    assert sdkExecutor.fastRad and sdkExecutor.noSuperSampling
+
+
+def testCompileWithoutMapObjects(sdkExecutor, tmp_path):
+    #the map file is loaded again, and if that fails the compile goes on
+    #with the current settings
+    _terrainMap(str(tmp_path / 'terrain.vmf'))
+    sdkExecutor.radTimeBudget = 0
+    sdkExecutor.setMapList([str(tmp_path / 'terrain.vmf')])
+    sdkExecutor.compile()
+    text = ''.join(sdkExecutor.recorder.text)
+    assert 'Could not plan lighting' in text or 'Lighting estimated' in text
+    assert (tmp_path / 'game' / 'maps' / 'terrain.bsp').is_file()
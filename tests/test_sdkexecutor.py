@@ -0,0 +1,97 @@
+import pytest
+
+from conftest import readToolLog, makeMapFiles
+
+
+## Get the intervals each tool ran in from the stand-in log
+#
+#  @return list of (start, end, tool, map name, arguments)
+def _runs(executor):
+    starts = {}
+    runs = []
+    for time, event, tool, mapName, arguments in readToolLog(executor):
+        if event == 'start':
+            starts[(tool, mapName)] = (time, arguments)
+        else:
+            start, arguments = starts.pop((tool, mapName))
+            runs.append((start, time, tool, mapName, arguments))
+    return runs
+
+
+## Get the most cores in use at once
+def _peakCores(runs, threads):
+    events = []
+    for start, end, tool, mapName, arguments in runs:
+        cost = 1 if tool == 'vbsp' else threads
+        events.append((start, cost))
+        events.append((end, -cost))
+    peak = used = 0
+    for time, cost in sorted(events, key = lambda x: (x[0], x[1])):
+        used += cost
+        peak = max(peak, used)
+    return peak
+
+
+def _checkChains(runs, mapCount):
+    for n in range(mapCount):
+        chain = sorted([x for x in runs if x[3] == 'map%i' % n])
+        assert [x[2] for x in chain] == ['vbsp', 'vvis', 'vrad']
+        for previous, following in zip(chain, chain[1:]):
+            assert previous[1] <= following[0]
+
+
+def testChainsOverlap(sdkExecutor, tmp_path):
+    sdkExecutor.cores = 3
+    sdkExecutor.setMapList(makeMapFiles(tmp_path, 3))
+    sdkExecutor.compile()
+    runs = _runs(sdkExecutor)
+    _checkChains(runs, 3)
+    assert all('-threads 1' in x[4] for x in runs if x[2] != 'vbsp')
+    assert 1 < _peakCores(runs, 1) <= 3
+    progress = sdkExecutor.recorder.progress
+    assert progress == sorted(progress) and progress[-1] == 1.0
+    assert sdkExecutor.recorder.status[-1] == 'Finished Compiling'
+
+
+def testCoreBudget(sdkExecutor, tmp_path):
+    #two maps share four cores, so vvis and vrad each use two
+    sdkExecutor.cores = 4
+    sdkExecutor.setMapList(makeMapFiles(tmp_path, 2))
+    sdkExecutor.compile()
+    runs = _runs(sdkExecutor)
+    _checkChains(runs, 2)
+    assert all('-threads 2' in x[4] for x in runs if x[2] != 'vbsp')
+    assert _peakCores(runs, 2) <= 4
+
+
+def testOneCore(sdkExecutor, tmp_path):
+    sdkExecutor.cores = 1
+    sdkExecutor.setMapList(makeMapFiles(tmp_path, 2))
+    sdkExecutor.compile()
+    runs = _runs(sdkExecutor)
+    _checkChains(runs, 2)
+    assert _peakCores(runs, 1) == 1
+    #earlier maps first
+    assert [x[3] for x in sorted(runs)][:3] == ['map0']*3
+
+
+def testFailureStopsChain(sdkExecutor, tmp_path, monkeypatch):
+    monkeypatch.setenv('STANDIN_FAIL', 'vvis map1')
+    sdkExecutor.cores = 1
+    sdkExecutor.setMapList(makeMapFiles(tmp_path, 2))
+    with pytest.raises(Exception) as error:
+        sdkExecutor.compile()
+    assert str(error.value) == 'vvis failed.'
+    runs = _runs(sdkExecutor)
+    assert not [x for x in runs if x[2] == 'vrad' and x[3] == 'map1']
+    assert not (tmp_path / 'game' / 'maps' / 'map0.bsp').exists()
+
+
+def testOutputForwarded(sdkExecutor, tmp_path, monkeypatch):
+    monkeypatch.setenv('STANDIN_OUTPUT_vvis', 'PortalFlow:  0...1...2...3...4...5...6...7...8...9...10 (1)\nno newline')
+    sdkExecutor.setMapList(makeMapFiles(tmp_path, 1))
+    sdkExecutor.compile()
+    text = ''.join(sdkExecutor.recorder.text)
+    assert 'PortalFlow:  0...1' in text
+    assert 'no newline\n' in text
+    assert [x[1:3] for x in sdkExecutor.phaseTimes] == [('vvis', 'PortalFlow')]
@@ -0,0 +1,72 @@
+from formats.sdkprogress import SDKProgress
+
+## vrad lighting pass, as printed by the SDK tools
+_VRAD_PASS = """Loading 10... entities
+BuildFacelights:  0...1...2...3...4...5...6...7...8...9...10 (12)
+BuildVisLeafs:  0...1...2...3...4...5...6...7...8...9...10 (3)
+Bounce #1 added RGB(2104, 1931, 1681)
+FinalLightFace:  0...1...2...3...4...5...6...7...8...9...10 (1)
+ThreadComputeLeafAmbient:  0...1...2...3...4...5...6...7...8...9...10 (0)
+Computing static prop lighting:  0...1...2...3...4...5...6...7...8...9...10 (0)
+"""
+
+_VRAD_PHASES = [
+    ('BuildFacelights', 12),
+    ('BuildVisLeafs', 3),
+    ('FinalLightFace', 1),
+    ('ThreadComputeLeafAmbient', 0),
+    ('Computing static prop lighting', 0)
+    ]
+
+
+## Feed a log in chunks of a size, recording progress after each
+def _feed(parser, log, size):
+    progress = []
+    for start in range(0, len(log), size):
+        parser.feed(log[start:start + size])
+        progress.append(parser.progress)
+    parser.close()
+    progress.append(parser.progress)
+    return progress
+
+
+def testVRADLog():
+    for size in (1, 3, 7, 4096):
+        parser = SDKProgress('vrad', clock = lambda: 0.0)
+        progress = _feed(parser, 'Valve Software - vrad.exe\n' + _VRAD_PASS + 'Ready to Finish\n', size)
+        assert progress == sorted(progress)
+        assert progress[-1] == 1.0
+        assert [(x[0], x[2]) for x in parser.phases] == _VRAD_PHASES
+
+
+def testMarkers():
+    parser = SDKProgress('vvis')
+    parser.feed('PortalFlow:  0...1...2...3')
+    assert parser.phase == 'PortalFlow'
+    #"3" has no dots yet, so the phase is 2/10 done
+    assert abs(parser.progress - 0.9*0.2) < 1e-9
+    parser.feed('...4...5...6...7...8...9...1')
+    assert abs(parser.progress - 0.9*0.9) < 1e-9
+    parser.feed('0 (5)\n')
+    assert parser.phase == None
+    assert abs(parser.progress - 0.9) < 1e-9
+    assert parser.phases[0][0::2] == ('PortalFlow', 5)
+
+
+def testHeaderNeedsColon():
+    parser = SDKProgress('vrad')
+    parser.feed('Loading 10...\nwriting 0... done\n')
+    assert parser.phases == []
+    assert parser.progress == 0.0
+
+
+def testBothPasses():
+    parser = SDKProgress('vrad', passes = 2, clock = lambda: 0.0)
+    progress = _feed(parser, _VRAD_PASS, 5)
+    assert progress == sorted(progress)
+    assert abs(progress[-1] - 0.5) < 1e-9
+    progress = _feed(parser, _VRAD_PASS, 5)
+    assert progress == sorted(progress)
+    assert progress[0] < 0.6
+    assert progress[-1] == 1.0
+    assert [(x[0], x[2]) for x in parser.phases] == _VRAD_PHASES*2
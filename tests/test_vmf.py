@@ -0,0 +1,147 @@
+import math
+import time
+
+import numpy
+import pytest
+
+import gameids
+from formats.vmf import VMF, Solid, Entity, Matrix
+
+
+def testSphereGeometry():
+    vmf = VMF(gameids.HL2)
+    sphere = Solid.fromSphere(vmf, [0, 0, 0], 256, 12, 'x')
+    assert len(sphere.sides) == 144
+    Solid.buildGeometry([sphere])
+    area = sum(side.area() for side in sphere.sides)
+    assert abs(area - 4*math.pi*256*256)/(4*math.pi*256*256) < 0.05
+    assert all(len(side.winding()) >= 3 for side in sphere.sides)
+
+
+def testManySidedSphereGeometry():
+    vmf = VMF(gameids.HL2)
+    sphere = Solid.fromSphere(vmf, [0, 0, 0], 256, 24, 'x')
+    assert len(sphere.sides) == 576
+    start = time.time()
+    Solid.buildGeometry([sphere])
+    assert time.time() - start < 10
+    assert len(sphere.vertices()) == 24*23 + 2
+    assert sphere.bounds() == ([-256.0, -256.0, -256.0], [256.0, 256.0, 256.0])
+    area = sum(side.area() for side in sphere.sides)
+    assert abs(area - 4*math.pi*256*256)/(4*math.pi*256*256) < 0.01
+
+
+def _rotatedEntity(defer, gameId):
+    vmf = VMF(gameId)
+    vmf.deferTransforms = defer
+    entity = Entity(vmf, 'prop_static')
+    entity['origin'] = [64, 0, 0]
+    entity.transform(Matrix.fromZAngle(math.pi/3))
+    entity['angles'] = [0, 0, 10]
+    entity['origin'] = [1, 2, 3]
+    return entity
+
+
+def testSetAfterDeferredTransform(hl2FGD):
+    eager = _rotatedEntity(False, hl2FGD)
+    deferred = _rotatedEntity(True, hl2FGD)
+    assert deferred['angles'] == eager['angles'] == [0, 0, 10]
+    assert deferred['origin'] == eager['origin'] == [1, 2, 3]
+
+
+def testCreateMany(hl2FGD):
+    origins = numpy.array([[0, 0, 0], [64, 0, 0], [0, 64, 16]])
+    angles = [[0, 0, 10], [0, 0, 20], [0, 0, 30]]
+    single = VMF(hl2FGD)
+    for origin, angle in zip(origins.tolist(), angles):
+        Entity(single, 'prop_static', origin=origin, angles=angle, model='models/a.mdl')
+    many = VMF(hl2FGD)
+    entities = Entity.createMany(many, 'prop_static', origins, angles, model=['models/a.mdl']*3)
+    assert entities == many.entities
+    for a, b in zip(single.entities, many.entities):
+        assert vars(a).keys() == vars(b).keys()
+        assert (a.id, a.properties, a.outputs) == (b.id, b.properties, b.outputs)
+
+
+def testCreateManyChecks(hl2FGD):
+    vmf = VMF(hl2FGD)
+    with pytest.raises(KeyError):
+        Entity.createMany(vmf, 'prop_static', [[0, 0, 0]], wrong=[1])
+    with pytest.raises(ValueError):
+        Entity.createMany(vmf, 'prop_static', [[0, 0, 0]], model=[])
+    assert vmf.entities == []
+
+
+@pytest.mark.parametrize('value, message', [
+    (numpy.zeros((5, 5)), 'got shape (5, 5)'),
+    (numpy.zeros((5, 0, 3)), 'got shape (5, 0, 3)'),
+    (7, 'got shape ()'),
+    ([[[0, 0, 0]], [[0, 0]]], 'got an irregular array'),
+    ])
+def testDisplacementShapeMismatch(value, message):
+    vmf = VMF(gameids.HL2)
+    side = Solid.fromMinMax(vmf, [0, 0, 0], [64, 64, 64]).sides[0]
+    side.power = 2
+    with pytest.raises(Exception) as error:
+        side.displacement = value
+    assert 'Expected shape (5, 5, 3), ' + message in str(error.value)
+    with pytest.raises(Exception) as error:
+        side.alpha = numpy.zeros((5, 4))
+    assert 'Expected shape (5, 5), got shape (5, 4)' in str(error.value)
+
+
+def _edge(side, edge):
+    return side.displacement[edge][:,2].astype(float)
+
+
+def testTerrainPowers():
+    # bumps in the first two columns of tiles, which also raise the edge of
+    # the third. The last two columns stay flat.
+    tiles = (5, 3)
+    heights = numpy.zeros((tiles[0]*16 + 1, tiles[1]*16 + 1))
+    random = numpy.random.RandomState(1)
+    for x, y, scale in [(0, 0, 64), (1, 0, 32), (0, 1, 16), (1, 2, 8)]:
+        heights[x*16:(x+1)*16 + 1, y*16:(y+1)*16 + 1] += random.uniform(0, scale, (17, 17))
+    # every tile at power 2, the 9 uneven ones at power 3, and 2 at power 4
+    budget = 15*25 + 9*(81 - 25) + 2*(289 - 81)
+    vmf = VMF(gameids.HL2)
+    solids = Solid.terrainFromArray(vmf, [0, 0, 0], 256, heights, power=4, vertexBudget=budget)
+    sides = numpy.array([solid.sides[0] for solid in solids]).reshape(tiles[1], tiles[0]).T
+    powers = numpy.vectorize(lambda side: int(side.power))(sides)
+
+    assert sum(side.vertexNum**2 for side in sides.ravel()) <= budget
+    assert set(powers.ravel()) == {2, 3, 4}
+    for x in range(tiles[0]):
+        for y in range(tiles[1]):
+            if heights[x*16:(x+1)*16 + 1, y*16:(y+1)*16 + 1].var() == 0:
+                assert powers[x,y] == 2
+
+    # neighbors with different powers must not leave cracks between them
+    pairs = [((x, y), (x + 1, y), (-1, slice(None)), (0, slice(None)))
+             for x in range(tiles[0] - 1) for y in range(tiles[1])]
+    pairs += [((x, y), (x, y + 1), (slice(None), -1), (slice(None), 0))
+              for x in range(tiles[0]) for y in range(tiles[1] - 1)]
+    for a, b, edgeA, edgeB in pairs:
+        heightsA = _edge(sides[a], edgeA)
+        heightsB = _edge(sides[b], edgeB)
+        if len(heightsA) < len(heightsB):
+            heightsA, heightsB = heightsB, heightsA
+        fine = numpy.linspace(0, 1, len(heightsA))
+        coarse = numpy.linspace(0, 1, len(heightsB))
+        assert numpy.allclose(heightsA, numpy.interp(fine, coarse, heightsB), atol=1e-3)
+
+
+def testReadingDefaultsKeepsEntitySparse(hl2FGD):
+    vmf = VMF(hl2FGD)
+    entity = Entity(vmf, 'light_environment')
+    outputs = entity.outputs['onuser1']
+    angles = entity['angles']
+    assert outputs == [] and angles == [0, 0, 0]
+    assert entity._outputs == {} and 'angles' not in entity._properties
+
+    angles[1] = 90
+    outputs.append('connection')
+    assert entity['angles'] == [0, 90, 0]
+    assert entity.outputs['onuser1'] == ['connection']
+    other = Entity(vmf, 'light_environment')
+    assert other['angles'] == [0, 0, 0] and other.outputs['onuser1'] == []